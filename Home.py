@@ -1,4 +1,5 @@
 import streamlit as st
+from utils.static_assets import style_tag, static_html
 
 # 페이지 설정 - 아이콘과 제목 설정
 st.set_page_config(
@@ -6,77 +7,12 @@ st.set_page_config(
     page_icon="🤖",  # 브라우저 탭에 표시될 아이콘 (이모지 또는 이미지 파일 경로)
 )
 
-# Streamlit의 기본 메뉴와 푸터 숨기기
-hide_menu_style = """
-    <style>
-    #MainMenu {visibility: hidden; }
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-"""
-st.markdown(hide_menu_style, unsafe_allow_html=True)
+# Streamlit의 기본 메뉴와 푸터 숨기기, 도구 링크 스타일 (프로세스마다 한 번만 만들어 재사용)
+st.markdown(style_tag("hide_menu.css", "home.css"), unsafe_allow_html=True)
 
 # 홈 화면 제목
 st.title("안전하게 경험하는 인공지능 첫걸음")
 st.info("대상학년: 초등학교 1~6학년")
 
-# 소개 문구
-st.markdown("""
-## 🎓 학생용 교육 도구 모음
-이 페이지에서는 다양한 AI 기반 교육 도구를 사용할 수 있습니다. 각 도구는 교육 활동을 지원하며, 창의적이고 상호작용적인 학습 경험을 제공합니다.
-""")
-
-# 도구 링크 및 설명
-col1, col2 = st.columns(2)
-
-with col1:
-    st.markdown(
-        """
-        <h4>1. 이미지 분석 도구</h4>
-        <a href="https://students.streamlit.app/vision" target="_blank" style="text-decoration: none;">
-            <span style="font-size: 100px;">🖼️</span>
-            <div style="text-align: center; font-size: 20px;">클릭하세요</div>
-        </a>
-        <p>이 도구를 사용하여 이미지를 분석하고, AI가 제공하는 다양한 인사이트를 학습할 수 있습니다.</p>
-        """,
-        unsafe_allow_html=True
-    )
-
-with col2:
-    st.markdown(
-        """
-        <h4>2. 텍스트 생성 도구</h4>
-        <a href="https://students.streamlit.app/text_gen" target="_blank" style="text-decoration: none;">
-            <span style="font-size: 100px;">📝</span>
-            <div style="text-align: center; font-size: 20px;">클릭하세요</div>
-        </a>
-        <p>이 도구를 사용하여 AI가 생성한 텍스트를 학습 자료로 활용할 수 있습니다.</p>
-        """,
-        unsafe_allow_html=True
-    )
-
-with col1:
-    st.markdown(
-        """
-        <h4>3. 이미지 생성 도구</h4>
-        <a href="https://students.streamlit.app/image_gen" target="_blank" style="text-decoration: none;">
-            <span style="font-size: 100px;">🖌️</span>
-            <div style="text-align: center; font-size: 20px;">클릭하세요</div>
-        </a>
-        <p>이 도구를 사용하여 AI가 생성한 이미지를 학습 자료로 사용할 수 있습니다. 창의적인 이미지 만들기에 도전해보세요.</p>
-        """,
-        unsafe_allow_html=True
-    )
-
-with col2:
-    st.markdown(
-        """
-        <h4>4. 챗봇 도구</h4>
-        <a href="https://students.streamlit.app/chatbot" target="_blank" style="text-decoration: none;">
-            <span style="font-size: 100px;">💬</span>
-            <div style="text-align: center; font-size: 20px;">클릭하세요</div>
-        </a>
-        <p>이 도구를 사용하여 AI와 특정한 주제로 대화할 수 있습니다. 수업과 관련된 내용으로 챗봇과 대화해보세요.</p>
-        """,
-        unsafe_allow_html=True
-    )
\ No newline at end of file
+# 소개 문구와 도구 링크 및 설명 (static/home.html을 한 번만 읽어 하나의 요소로 표시)
+st.markdown(static_html("home.html"), unsafe_allow_html=True)
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import pathlib
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+# 수업 시작 때처럼 여러 학생이 동시에 홈 화면에 들어올 때의 시작 시간과 첫 화면 표시 시간을 잽니다.
+# Streamlit 서버를 띄운 뒤 브라우저 대신 웹소켓 클라이언트 여러 개가 동시에 접속하여
+# 첫 화면 요소(delta)가 도착하기까지의 시간과 스크립트 실행이 끝나기까지의 시간을 기록합니다.
+#
+#   python benchmarks/home_first_paint.py --clients 100
+#   git show <이전 커밋>:Home.py > /tmp/old_home.py && python benchmarks/home_first_paint.py --app /tmp/old_home.py
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port):
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(app),
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.headless", "true",
+        "--server.enableXsrfProtection", "false",
+        "--browser.gatherUsageStats", "false",
+    ]
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_healthy(port, timeout=60):
+    # 서버 프로세스 시작부터 /_stcore/health 응답까지의 시간
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Streamlit 서버가 시작되지 않았습니다.")
+
+
+async def open_page(port):
+    """접속 한 번: (첫 요소까지 걸린 시간, 실행 완료까지 걸린 시간, 받은 바이트)"""
+    from tornado.websocket import websocket_connect
+    from tornado.httpclient import HTTPRequest
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    started = time.perf_counter()
+    request = HTTPRequest(f"ws://127.0.0.1:{port}/_stcore/stream")
+    connection = await websocket_connect(request, subprotocols=["streamlit"])
+    rerun = BackMsg()
+    rerun.rerun_script.query_string = ""
+    rerun.rerun_script.page_script_hash = ""
+    await connection.write_message(rerun.SerializeToString(), binary=True)
+
+    first_paint = None
+    received = 0
+    try:
+        while True:
+            data = await connection.read_message()
+            if data is None:
+                raise RuntimeError("서버가 연결을 끊었습니다.")
+            received += len(data)
+            msg = ForwardMsg.FromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "delta" and first_paint is None:
+                first_paint = time.perf_counter() - started
+            if kind == "script_finished":
+                return first_paint, time.perf_counter() - started, received
+    finally:
+        connection.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(port, clients, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with limit:
+            return await open_page(port)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(clients)))
+    return results, time.perf_counter() - started
+
+
+def report(label, values):
+    print(
+        f"  {label}: 중앙값 {statistics.median(values) * 1000:.0f}ms, "
+        f"p95 {percentile(values, 0.95) * 1000:.0f}ms, 최대 {max(values) * 1000:.0f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="홈 화면 첫 표시 시간 벤치마크")
+    parser.add_argument("--app", default=str(ROOT / "Home.py"), help="측정할 Streamlit 스크립트")
+    parser.add_argument("--clients", type=int, default=100, help="접속할 학생 수")
+    parser.add_argument("--concurrency", type=int, default=50, help="동시에 접속하는 수")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(args.app, port)
+    try:
+        startup = wait_until_healthy(port)
+        print(f"서버 시작: {startup * 1000:.0f}ms")
+
+        # 첫 접속 (모듈을 처음 불러오고 정적 파일을 처음 읽는 비용 포함)
+        first_paint, finished, received = asyncio.run(open_page(port))
+        print(f"첫 접속: 첫 표시 {first_paint * 1000:.0f}ms, 완료 {finished * 1000:.0f}ms, {received:,} 바이트")
+
+        results, wall_time = asyncio.run(run_load(port, args.clients, args.concurrency))
+        print(f"동시 접속 {args.clients}명 (동시에 {args.concurrency}명): 전체 {wall_time:.2f}초")
+        report("첫 표시", [first_paint for first_paint, _, _ in results])
+        report("실행 완료", [finished for _, finished, _ in results])
+        print(f"  접속당 받은 바이트: {statistics.mean(received for _, _, received in results):,.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import random
+import pathlib
+import argparse
+
+# 노션 활동 페이지를 기록으로 바꾸는 속도를 이전 방식(페이지마다 다른 dict 탐색, 첫 rich_text 조각만 읽기)과 비교합니다.
+# 페이지들은 활동 코드마다 노션에 조회한 뒤 페이지 하나를 파싱하므로 여기서 재는 것은 조회 한 번당 파싱 비용입니다.
+# 새 파서는 모든 조각을 이어 붙이고 값을 검사하므로 이전 방식보다 느릴 수 있습니다 (노션 왕복 시간에 비하면 아주 작음).
+# 내보낸 데이터베이스가 없으면 가짜 페이지를 만들어 씁니다.
+#
+#   python benchmarks/notion_parse_bench.py --pages 50000
+#   python benchmarks/notion_parse_bench.py --export exported_query.json   # 노션 query 응답(JSON)
+
+ROOT = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.notion_records import ActivitySchema, parse_page
+
+
+def rich_text(text, segment_length=2000):
+    # 노션은 긴 글을 2000자 단위 조각으로 나눔
+    return {"rich_text": [
+        {"type": "text", "text": {"content": text[i:i + segment_length]}, "plain_text": text[i:i + segment_length]}
+        for i in range(0, len(text), segment_length)
+    ]}
+
+
+def fake_pages(count, seed=0):
+    rng = random.Random(seed)
+    words = ["친구", "동물", "우주", "바다", "로봇", "숲", "기차", "과학자", "요리사", "화가"]
+    pages = []
+    for index in range(count):
+        prompt = " ".join(rng.choice(words) for _ in range(rng.choice([50, 200, 900])))  # 일부는 2000자를 넘음
+        pages.append({"properties": {
+            "activity_code": rich_text(f"code{index}"),
+            "prompt": rich_text(prompt),
+            "student_view": rich_text(f"{index}번 활동"),
+            "email": rich_text("teacher@example.com"),
+            "adjectives": rich_text(json.dumps([rng.choice(words) for _ in range(8)], ensure_ascii=False)),
+            "settings": rich_text(json.dumps({"rate_limit": {"requests_per_minute": 10}})),
+        }})
+    return pages
+
+
+def legacy_parse(page):
+    # 이전 방식: 첫 번째 조각만 읽고 형용사와 설정을 조회마다 json.loads
+    properties = page.get("properties", {})
+    prompt_rich_text = properties.get("prompt", {}).get("rich_text", [])
+    prompt = prompt_rich_text[0].get("text", {}).get("content", "") if prompt_rich_text else ""
+    student_view_rich_text = properties.get("student_view", {}).get("rich_text", [])
+    student_view = student_view_rich_text[0].get("text", {}).get("content", "") if student_view_rich_text else ""
+    email_rich_text = properties.get("email", {}).get("rich_text", [])
+    teacher_email = email_rich_text[0].get("plain_text", "") if email_rich_text else ""
+    adjectives = []
+    if properties.get("adjectives", {}).get("rich_text"):
+        try:
+            adjectives = json.loads(properties["adjectives"]["rich_text"][0]["text"]["content"])
+        except json.JSONDecodeError:
+            pass
+    settings = {}
+    if properties.get("settings", {}).get("rich_text"):
+        try:
+            settings = json.loads(properties["settings"]["rich_text"][0]["text"]["content"])
+        except json.JSONDecodeError:
+            pass
+    return prompt, student_view, teacher_email, adjectives, settings
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="노션 기록 파서 처리량 벤치마크")
+    parser.add_argument("--pages", type=int, default=20000, help="가짜 페이지 수 (--export가 없을 때)")
+    parser.add_argument("--export", help="노션 query 응답 JSON 파일 (results 목록)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.export:
+        data = json.loads(pathlib.Path(args.export).read_text(encoding="utf-8"))
+        pages = data["results"] if isinstance(data, dict) else data
+    else:
+        pages = fake_pages(args.pages)
+    schema = ActivitySchema(required=("prompt",))
+    print(f"페이지 {len(pages):,}개")
+
+    legacy_time, legacy = timed(lambda: [legacy_parse(page) for page in pages], args.repeat)
+    parse_time, records = timed(lambda: [parse_page(page, schema) for page in pages], args.repeat)
+    print(f"이전 방식: {len(pages) / legacy_time:,.0f} 페이지/초")
+    print(f"새 파서:   {len(pages) / parse_time:,.0f} 페이지/초 (조각 이어 붙이기와 검사 포함)")
+
+    truncated = sum(
+        1 for old, record in zip(legacy, records) if record is not None and len(old[0]) < len(record.prompt)
+    )
+    print(f"이전 방식에서 잘린 프롬프트: {truncated:,}개")
+    print(f"페이지 하나당: 이전 방식 {legacy_time / len(pages) * 1e6:.1f}µs, 새 파서 {parse_time / len(pages) * 1e6:.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import smtplib
+import argparse
+
+# 기록된 노션·OpenAI·Gemini 응답(fixture)으로 학생 활동 시나리오를 오프라인에서 다시 실행하고
+# 시나리오마다 토큰, 바이트, 걸린 시간을 기준값(baseline.json)과 비교합니다.
+#
+#   python benchmarks/replay_bench.py --record            # 실제 서비스로 실행하며 fixture 기록
+#   python benchmarks/replay_bench.py                     # fixture로 재생하며 기준값과 비교
+#   python benchmarks/replay_bench.py --update-baseline   # 재생 결과를 새 기준값으로 저장
+#
+# 이미지 분석 페이지는 Streamlit AppTest가 file_uploader를 지원하지 않아 시나리오에 포함하지 않습니다.
+
+ROOT = pathlib.Path(__file__).parent.parent
+BENCH_DIR = pathlib.Path(__file__).parent
+SECRETS_PATH = ROOT / ".streamlit" / "secrets.toml"
+
+# 재생용 가짜 비밀 값 (fixture가 있으면 실제 키가 필요 없음)
+REPLAY_SECRETS = {
+    "api": {"keys": ["replay"]},
+    "google": {"gemini_api_key1": "replay"},
+    "notion": {
+        "api_key": "replay",
+        "database_id_vision": "vision",
+        "database_id_text": "text",
+        "database_id_image": "image",
+        "database_id_chatbot": "chatbot",
+    },
+    "email": {"address": "replay@example.com", "password": "replay"},
+}
+
+
+class CountingSMTP:
+    """이메일을 보내지 않고 크기만 세는 SMTP 대역"""
+
+    sent_bytes = 0
+    sent_count = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, *args):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        CountingSMTP.sent_bytes += len(msg)
+        CountingSMTP.sent_count += 1
+
+
+def find_widget(at, kind, label):
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    raise LookupError(f"'{label}' {kind}를 찾을 수 없습니다.")
+
+
+def run_scenario(scenario, secrets):
+    from streamlit.testing.v1 import AppTest
+    from utils import replay, shared_state, hedge
+    from utils.model_router import model_router
+
+    # 시나리오마다 공유 상태(차단기 포함), 응답 시간 통계와 기록을 비우고 시작 (앞 시나리오의 영향을 받지 않게)
+    shared_state._store = shared_state.MemoryStore()
+    hedge.reset_stats()
+    model_router.reset_stats()
+    replay.call_log.clear()
+    CountingSMTP.sent_bytes = CountingSMTP.sent_count = 0
+
+    at = AppTest.from_file(str(ROOT / "pages" / scenario["page"]), default_timeout=300)
+    for section, values in secrets.items():
+        at.secrets[section] = values
+
+    wall_time = 0.0
+    started = time.perf_counter()
+    at.run()
+    wall_time += time.perf_counter() - started
+
+    for step in scenario["steps"]:
+        if "text_input" in step:
+            find_widget(at, "text_input", step["text_input"]).input(step["value"])
+        elif "text_area" in step:
+            find_widget(at, "text_area", step["text_area"]).input(step["value"])
+        elif "selectbox" in step:
+            find_widget(at, "selectbox", step["selectbox"]).select(step["value"])
+        elif "button" in step:
+            find_widget(at, "button", step["button"]).click()
+        elif "chat_input" in step:
+            at.chat_input[0].set_value(step["chat_input"])
+        started = time.perf_counter()
+        at.run()
+        wall_time += time.perf_counter() - started
+
+    errors = [element.value for element in at.exception] + [element.value for element in at.error]
+    return {
+        "wall_time": round(wall_time, 3),
+        "provider_calls": len(replay.call_log),
+        "provider_latency": round(sum(call["latency"] for call in replay.call_log), 3),
+        "tokens": sum(call["tokens"] for call in replay.call_log),
+        "response_bytes": sum(call["bytes"] for call in replay.call_log),
+        "email_count": CountingSMTP.sent_count,
+        "email_bytes": CountingSMTP.sent_bytes,
+        "errors": len(errors),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # 기준값보다 tolerance 비율 이상 커진 항목을 회귀로 판단
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        print(f"\n[{name}]")
+        for metric, value in metrics.items():
+            if base is None or metric not in base:
+                print(f"  {metric:>17}: {value}")
+                continue
+            before = base[metric]
+            change = (value - before) / before * 100 if before else 0.0
+            marker = ""
+            if value > before * (1 + tolerance):
+                marker = "  ⚠️ 회귀"
+                regressions.append((name, metric))
+            print(f"  {metric:>17}: {value} (기준 {before}, {change:+.1f}%){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="기록된 응답으로 학생 활동 시나리오 성능 측정")
+    parser.add_argument("--record", action="store_true", help="실제 서비스를 호출하여 fixture 기록")
+    parser.add_argument("--scenarios", default=str(BENCH_DIR / "scenarios.json"))
+    parser.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true", help="결과를 새 기준값으로 저장")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="회귀로 볼 증가 비율")
+    parser.add_argument("--only", help="이 이름이 들어간 시나리오만 실행")
+    args = parser.parse_args()
+
+    # 저장소에는 fixture와 기준값이 들어 있지 않음 (실제 응답에 학생 입력과 교사 프롬프트가 담기므로)
+    # 재생하기 전에 둘 다 있는지 확인하여, 없으면 시나리오를 돌리지 않고 바로 안내
+    fixtures_dir = pathlib.Path(os.environ.get("PROVIDER_FIXTURES_DIR", BENCH_DIR / "fixtures"))
+    baseline_path = pathlib.Path(args.baseline)
+    if not args.record:
+        if not any(fixtures_dir.glob("*.json")):
+            sys.exit(
+                f"재생할 fixture가 없습니다: {fixtures_dir}\n"
+                "먼저 .streamlit/secrets.toml을 준비하고 --record로 실제 응답을 기록하세요."
+            )
+        if not args.update_baseline and not baseline_path.exists():
+            sys.exit(
+                f"기준값 파일이 없습니다: {baseline_path}\n"
+                "먼저 --update-baseline으로 현재 재생 결과를 기준값으로 저장하세요."
+            )
+
+    # utils.replay를 불러오기 전에 모드를 정해야 함
+    os.environ["PROVIDER_REPLAY_MODE"] = "record" if args.record else "replay"
+    # 벤치마크 사용량은 실제 사용량 기록에 섞지 않음
+    os.environ["USAGE_DB_PATH"] = str(BENCH_DIR / "bench_usage.db")
+    os.environ["ARCHIVE_DB_PATH"] = str(BENCH_DIR / "bench_archive.db")
+    sys.path.insert(0, str(ROOT))
+    smtplib.SMTP_SSL = CountingSMTP
+
+    # 페이지 중 일부는 secrets.toml 파일을 직접 읽으므로, 재생 시 파일이 없으면 잠시 만들어 둠
+    import toml
+    created_secrets = False
+    if SECRETS_PATH.exists():
+        secrets = toml.load(SECRETS_PATH)
+    elif args.record:
+        sys.exit("기록 모드에는 .streamlit/secrets.toml이 필요합니다.")
+    else:
+        secrets = REPLAY_SECRETS
+        SECRETS_PATH.parent.mkdir(exist_ok=True)
+        SECRETS_PATH.write_text(toml.dumps(secrets), encoding="utf-8")
+        created_secrets = True
+
+    try:
+        scenarios = json.loads(pathlib.Path(args.scenarios).read_text(encoding="utf-8"))
+        results = {}
+        for scenario in scenarios:
+            if args.only and args.only not in scenario["name"]:
+                continue
+            results[scenario["name"]] = run_scenario(scenario, secrets)
+    finally:
+        if created_secrets:
+            SECRETS_PATH.unlink()
+
+    if args.record:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    regressions = compare(results, baseline, args.tolerance)
+    missing = [name for name in results if name not in baseline]
+
+    if args.update_baseline:
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\n기준값을 저장했습니다: {baseline_path}")
+    elif missing:
+        sys.exit(f"\n기준값에 없는 시나리오 {len(missing)}개: {', '.join(missing)} (--update-baseline으로 추가하세요)")
+    elif regressions:
+        sys.exit(f"\n회귀 {len(regressions)}건: " + ", ".join(f"{name}.{metric}" for name, metric in regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import sys
+import pathlib
+
+# 챗봇 페이지가 매 실행(메시지 한 번마다)마다 보내는 정적 스타일의 크기를 이전 방식과 비교합니다.
+#
+#   python benchmarks/static_payload.py
+
+ROOT = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from utils.static_assets import style_tag
+
+# 이전 방식: 메뉴 숨기기 CSS와 실행되지 않는 DOMContentLoaded 스크립트, 주석과 들여쓰기가 그대로 있는 CSS
+LEGACY_MARKDOWN = ("""
+    <style>
+    #MainMenu {visibility: hidden; }
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    </style>
+    <script>
+    document.addEventListener("DOMContentLoaded", function() {
+        var mainMenu = document.getElementById('MainMenu');
+        if (mainMenu) {
+            mainMenu.style.display = 'none';
+        }
+        var footer = document.getElementsByTagName('footer')[0];
+        if (footer) {
+            footer.style.display = 'none';
+        }
+        var header = document.getElementsByTagName('header')[0];
+        if (header) {
+            header.style.display = 'none';
+        }
+    });
+    </script>
+""",
+    """
+    <style>
+        body, .stApp, .stChatFloatingInputContainer {
+            background-color: #F0FFF0 !important; /* 전체 배경을 Honeydew로 설정 */
+        }
+        .stChatInputContainer {
+            background-color: #F0FFF0 !important; /* 입력 필드 주변 배경도 동일한 색으로 변경 */
+        }
+        textarea {
+            background-color: #FFFFFF !important; /* 실제 입력 필드는 흰색으로 설정 */
+        }
+        /* 누적 스크롤을 위한 chat-container 스타일 추가 */
+        .chat-container {
+            max-height: 500px; /* 원하는 높이로 조정 가능 */
+            overflow-y: auto;
+            padding: 10px;
+            border: 1px solid #ccc;
+            border-radius: 5px;
+            background-color: #FFFFFF;
+            margin-bottom: 20px;
+        }
+    </style>
+    """)
+
+
+def markdown_payload(body):
+    # st.markdown 요소 하나가 ForwardMsg로 직렬화된 크기 (Streamlit이 없으면 본문 크기)
+    try:
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    except ImportError:
+        return len(body.encode("utf-8"))
+    msg = ForwardMsg()
+    msg.delta.new_element.markdown.body = body
+    msg.delta.new_element.markdown.allow_html = True
+    return msg.ByteSize()
+
+
+def main():
+    before = sum(markdown_payload(body) for body in LEGACY_MARKDOWN)
+    after = markdown_payload(style_tag("hide_menu.css", "chatbot.css"))
+    print(f"이전 방식: 실행마다 {before:,} 바이트 (markdown 요소 {len(LEGACY_MARKDOWN)}개)")
+    print(f"현재 방식: 실행마다 {after:,} 바이트 (markdown 요소 1개)")
+    print(f"감소: {before - after:,} 바이트 ({(before - after) / before * 100:.1f}%)")
+    for turns in (10, 50):
+        # 메시지 한 번마다 답변 후 st.rerun()까지 두 번 실행됨
+        print(f"  대화 {turns}턴 기준: {before * turns * 2:,} → {after * turns * 2:,} 바이트")
+
+
+if __name__ == "__main__":
+    main()
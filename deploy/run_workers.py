@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import signal
+import pathlib
+import argparse
+import subprocess
+
+# 여러 Streamlit 워커 프로세스를 실행합니다.
+# 워커들은 SHARED_STATE_PATH의 SQLite(WAL 모드) 파일로 노션 조회 캐시, 요청 제한, 메일 대기열을 공유하고,
+# 앞단의 리버스 프록시(deploy/nginx.conf)가 요청을 나누어 보냅니다.
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 워커 여러 개 실행")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="실행할 워커 수")
+    parser.add_argument("--base-port", type=int, default=8501, help="첫 번째 워커 포트")
+    parser.add_argument("--state-path", default=str(ROOT / "shared_state.db"), help="공유 상태 SQLite 파일 경로")
+    args = parser.parse_args()
+
+    env = dict(os.environ, SHARED_STATE_PATH=args.state_path)
+    workers = []
+    for index in range(args.workers):
+        port = args.base_port + index
+        command = [
+            sys.executable, "-m", "streamlit", "run", str(ROOT / "Home.py"),
+            "--server.port", str(port),
+            "--server.address", "127.0.0.1",
+            "--server.headless", "true",
+        ]
+        workers.append(subprocess.Popen(command, cwd=ROOT, env=env))
+        print(f"워커 {index + 1} 실행: http://127.0.0.1:{port}")
+
+    def stop(*_):
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # 종료된 워커는 같은 포트로 다시 실행
+    while True:
+        time.sleep(5)
+        for index, worker in enumerate(workers):
+            if worker.poll() is not None:
+                print(f"워커 {index + 1}가 종료되어 다시 실행합니다.")
+                workers[index] = subprocess.Popen(worker.args, cwd=ROOT, env=env)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 import streamlit as st
 import google.generativeai as genai
-import requests
 import pathlib
 import toml
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, UnidentifiedImageError
 import io
+from utils.static_assets import style_tag
+from utils.rate_limit import merge_rate_limit_config, rate_limiter, current_session_id
+from utils.prefetch import start_prefetch, resolve_activity
+from utils.notion_records import ActivitySchema, thaw
+from utils.notion_client import query_activity
+from utils.usage import record_usage
+from utils.model_router import merge_router_config, model_router
+from utils.hedge import merge_deadline_config
+from utils.circuit_breaker import friendly_error
+from utils.mailer import send_or_queue
+from utils.archive import archive_result
 
 # 페이지 설정 - 아이콘과 제목 설정
 st.set_page_config(
@@ -15,46 +25,8 @@ st.set_page_config(
     page_icon="🤖",
 )
 
-# Streamlit의 배경색 변경
-background_color = "#E0FFFF"
-
-# 배경색 변경을 위한 CSS
-page_bg_css = f"""
-<style>
-    .stApp {{
-        background-color: {background_color};
-    }}
-</style>
-"""
-
-# Streamlit의 기본 메뉴와 푸터 숨기기
-hide_menu_style = """
-    <style>
-    #MainMenu {visibility: hidden; }
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-    <script>
-    document.addEventListener("DOMContentLoaded", function() {
-        var mainMenu = document.getElementById('MainMenu');
-        if (mainMenu) {
-            mainMenu.style.display = 'none';
-        }
-        var footer = document.getElementsByTagName('footer')[0];
-        if (footer) {
-            footer.style.display = 'none';
-        }
-        var header = document.getElementsByTagName('header')[0];
-        if (header) {
-            header.style.display = 'none';
-        }
-    });
-    </script>
-"""
-
-# Streamlit에서 HTML 및 CSS 적용
-st.markdown(hide_menu_style, unsafe_allow_html=True)
-st.markdown(page_bg_css, unsafe_allow_html=True)
+# Streamlit의 기본 메뉴와 푸터 숨기기, 배경색 변경 (static/의 CSS를 프로세스마다 한 번만 만들어 재사용)
+st.markdown(style_tag("hide_menu.css", "vision.css"), unsafe_allow_html=True)
 
 # secrets.toml 파일 경로
 secrets_path = pathlib.Path(__file__).parent.parent / ".streamlit/secrets.toml"
@@ -67,67 +39,65 @@ with open(secrets_path, "r") as f:
 gemini_api_key1 = secrets["google"]["gemini_api_key1"]
 genai.configure(api_key=gemini_api_key1)
 
+# 한 번에 올릴 수 있는 이미지 수와 이미지별 분석 시 동시 요청 수
+MAX_IMAGES = 6
+MAX_CONCURRENT_REQUESTS = 3
+# 모델에 보내기 전 이미지의 긴 변 최대 크기(픽셀)
+MAX_IMAGE_SIDE = 1536
+
 # Notion API 설정
 NOTION_API_KEY = secrets["notion"]["api_key"]
 DATABASE_ID = secrets["notion"]["database_id_vision"]
+# 이 페이지에 필요한 노션 속성 (프롬프트와 학생용 안내는 반드시 있어야 함)
+ACTIVITY_SCHEMA = ActivitySchema(required=("prompt", "student_view"))
 
 # Notion에서 프롬프트, 학생 뷰, 교사 이메일 가져오기
 def fetch_prompt_student_view_email_from_notion(activity_code):
-    url = f"https://api.notion.com/v1/databases/{DATABASE_ID}/query"
-    headers = {
-        "Authorization": f"Bearer {NOTION_API_KEY}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28"
-    }
-    data = {
-        "filter": {
-            "property": "activity_code",
-            "rich_text": {
-                "equals": activity_code
-            }
-        }
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        results = response.json().get("results")
-        if results:
-            for result in results:
-                properties = result.get("properties", {})
-                
-                # 'prompt' 속성에서 텍스트 콘텐츠 가져오기
-                prompt_property = properties.get("prompt", {})
-                prompt_rich_text = prompt_property.get("rich_text", [])
-                if not prompt_rich_text:
-                    continue
-                prompt = prompt_rich_text[0].get("text", {}).get("content", "")
-                
-                # 'student_view' 속성에서 텍스트 콘텐츠 가져오기
-                student_view_property = properties.get("student_view", {})
-                student_view_rich_text = student_view_property.get("rich_text", [])
-                if not student_view_rich_text:
-                    continue
-                student_view = student_view_rich_text[0].get("text", {}).get("content", "")
-                
-                # 'email' 속성에서 plain_text 가져오기 (선택 사항)
-                email_property = properties.get("email", {})
-                email_rich_text = email_property.get("rich_text", [])
-                teacher_email = ""
-                if email_rich_text:
-                    teacher_email = email_rich_text[0].get("plain_text", "")
-    
-                # **차단 지침 추가**
-                blocking_instructions = (
-                    "\n\n"
-                    "학생의 입력이 설정된 역할과 관련이 없거나 이상한 내용이 포함되어 있다면, "
-                    "그 내용에 대해 응답하지 말고 주어진 역할에 집중해 주세요."
-                )
-                prompt += blocking_instructions  # 프롬프트에 차단 지침 추가
-                
-                return prompt, student_view, teacher_email
-    return None, None, None
+    record = query_activity(NOTION_API_KEY, DATABASE_ID, activity_code, ACTIVITY_SCHEMA)
+    if record is None:
+        return None, None, None, {}, []
+
+    # **차단 지침 추가**
+    blocking_instructions = (
+        "\n\n"
+        "학생의 입력이 설정된 역할과 관련이 없거나 이상한 내용이 포함되어 있다면, "
+        "그 내용에 대해 응답하지 말고 주어진 역할에 집중해 주세요."
+    )
+    prompt = record.prompt + blocking_instructions  # 프롬프트에 차단 지침 추가
+    return prompt, record.student_view, record.teacher_email, thaw(record.settings), list(record.problems)
+
+# 업로드한 이미지를 읽고 모델에 보낼 크기로 줄이기 (여러 이미지를 병렬로 처리)
+def preprocess_image(uploaded_file):
+    img_bytes = uploaded_file.getvalue()
+    img = Image.open(io.BytesIO(img_bytes))
+    img.load()
+    img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+    return uploaded_file.name, img_bytes, img
+
+# 응답의 토큰 사용량을 요청 제한과 사용량 기록에 반영
+def record_response_usage(response, rate_limit_key, model_name):
+    if response.usage_metadata:
+        rate_limiter.record_tokens(rate_limit_key, response.usage_metadata.total_token_count)
+    record_usage(rate_limit_key, "gemini", model_name.removeprefix("models/"), response)
+
+# 응답을 끝까지 받은 뒤 사용량을 기록하고 텍스트 반환 (이미지마다 따로 분석할 때)
+def response_text(response, rate_limit_key, model_name):
+    response.resolve()
+    record_response_usage(response, rate_limit_key, model_name)
+    return response.text
+
+# 도착하는 조각을 그대로 화면에 넘기고, 다 받으면 사용량 기록 (st.write_stream용)
+def stream_text(chunks, response, rate_limit_key, model_name):
+    received = False
+    for text in chunks:
+        received = True
+        yield text
+    if not received:
+        response.text  # 안전 필터로 막힌 응답 등은 여기서 오류를 발생시킴
+    record_response_usage(response, rate_limit_key, model_name)
 
-# 이메일 전송 기능
-def send_email_to_teacher(student_name, teacher_email, prompt, image_data, ai_response):
+# 이메일 전송 기능 (이미지는 첨부하지 않고 결과 보관함의 결과 번호만 알림)
+def send_email_to_teacher(student_name, teacher_email, result_id, image_count, ai_response):
     if not teacher_email:
         st.info("⚠️ 교사 이메일이 설정되어 있지 않아 이메일을 전송하지 않습니다.")
         return False  # 이메일 전송 건너뜀
@@ -139,29 +109,22 @@ def send_email_to_teacher(student_name, teacher_email, prompt, image_data, ai_re
 
     body = f"""
     학생 이름: {student_name}
-
-    사용된 프롬프트:
-    {prompt}
+    결과 번호: {result_id or "보관 실패"} (이미지 {image_count}장과 프롬프트는 교사용 관리 페이지의 결과 보관함에서 볼 수 있습니다)
 
     AI 생성 결과:
     {ai_response}
     """
     msg.attach(MIMEText(body, "plain"))
 
-    # 이미지 첨부
-    img = MIMEText(image_data, "base64", "utf-8")
-    img.add_header("Content-Disposition", "attachment", filename="image.png")
-    msg.attach(img)
-
-    # 이메일 전송
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(secrets["email"]["address"], secrets["email"]["password"])
-            server.send_message(msg)
-        return True  # 이메일 전송 성공 시 True 반환
-    except Exception as e:
-        st.error(f"이메일 전송에 실패했습니다: {e}")
-        return False  # 이메일 전송 실패 시 False 반환
+    # 이메일 전송 (메일 서버에 연결할 수 없으면 보관해 두었다가 나중에 전송)
+    status = send_or_queue(msg, secrets["email"]["address"], secrets["email"]["password"])
+    if status == "queued":
+        st.info("📮 메일 서버에 연결할 수 없어 결과를 보관해 두었습니다. 연결되면 교사에게 자동으로 전송됩니다.")
+        return False
+    if status == "rejected":
+        st.warning("⚠️ 메일 서버가 메일을 거부하여 결과를 전송하지 못했습니다. 선생님께 이메일 주소를 확인해 달라고 말씀드리세요.")
+        return False
+    return True  # 이메일 전송 성공 시 True 반환
 
 # 학생용 UI
 st.header('📸 학생용: AI 교육 활동 도구')
@@ -171,8 +134,8 @@ st.markdown("""
     1. **학생 이름 입력**: 본인의 이름을 입력하세요.
     2. **활동 코드 입력**: 교사가 제공한 활동 코드를 입력하세요.
     3. **프롬프트 가져오기**: 활동 코드에 해당하는 프롬프트를 불러옵니다.
-    4. **이미지 업로드**: 교육 활동에 사용할 이미지를 업로드하거나 카메라로 촬영하세요.
-    5. **AI 활동 수행**: AI가 제공된 프롬프트와 이미지를 바탕으로 창의적인 교육 활동을 도와줍니다.
+    4. **이미지 업로드**: 교육 활동에 사용할 이미지를 업로드하거나 카메라로 촬영하세요. 여러 장을 함께 올릴 수 있습니다.
+    5. **AI 활동 수행**: 'AI 분석 시작' 버튼을 누르면 AI가 프롬프트와 이미지를 바탕으로 창의적인 교육 활동을 도와줍니다.
 """)
 
 # 학생 이름 입력 필드 추가
@@ -180,18 +143,30 @@ student_name = st.text_input("🔑 학생 이름 입력", value="", max_chars=50
 if not student_name:
     st.warning("학생 이름을 입력하세요.")
 
+# 활동 코드 입력이 바뀌면 버튼을 누르기 전에 미리 노션 조회 시작
+def prefetch_activity():
+    start_prefetch(st.session_state, "vision", st.session_state.activity_code_input, fetch_prompt_student_view_email_from_notion)
+
 # 활동 코드 입력 필드
-activity_code = st.text_input("🔑 활동 코드 입력")
+activity_code = st.text_input("🔑 활동 코드 입력", key="activity_code_input", on_change=prefetch_activity)
 
 if st.button("📄 프롬프트 가져오기", key="get_prompt"):
     if activity_code:
         with st.spinner("🔍 프롬프트를 불러오는 중..."):
-            prompt, student_view, teacher_email = fetch_prompt_student_view_email_from_notion(activity_code)
+            try:
+                prompt, student_view, teacher_email, settings, problems = resolve_activity(st.session_state, "vision", activity_code, fetch_prompt_student_view_email_from_notion)
+            except Exception as e:
+                st.error(friendly_error(e))
+                st.stop()
             if prompt and student_view:
                 st.session_state.prompt = prompt
                 st.session_state.student_view = student_view
                 st.session_state.teacher_email = teacher_email  # None 또는 빈 문자열일 수 있음
+                st.session_state.settings = settings
+                st.session_state.activity_code = activity_code
                 st.success("✅ 프롬프트를 성공적으로 불러왔습니다.")
+                for problem in problems:
+                    st.warning(f"⚠️ 노션 활동 설정의 일부를 읽지 못해 기본값을 사용합니다. 선생님께 알려 주세요. ({problem})")
             else:
                 st.error("⚠️ 활동 코드를 다시 확인하세요.")  # 코드 불러오기 실패 시 오류 메시지
     else:
@@ -200,39 +175,99 @@ if st.button("📄 프롬프트 가져오기", key="get_prompt"):
 if "prompt" in st.session_state and st.session_state.prompt and "student_view" in st.session_state and st.session_state.student_view:
     st.write("**프롬프트:** " + st.session_state.student_view)
 
-    # 이미지 업로드 또는 카메라 촬영
+    # 이미지 업로드 또는 카메라 촬영 (여러 장 가능)
     st.write("📸 이미지를 업로드하거나 카메라로 촬영하여 프롬프트를 처리하세요.")
-    image = st.file_uploader("이미지 업로드", type=["jpg", "jpeg", "png"])
+    images = st.file_uploader("이미지 업로드", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+    if len(images) > MAX_IMAGES:
+        st.warning(f"⚠️ 이미지는 한 번에 {MAX_IMAGES}장까지 분석할 수 있습니다. 앞의 {MAX_IMAGES}장만 사용합니다.")
+        images = images[:MAX_IMAGES]
+
+    # 학생별 요청 제한과 남은 토큰 예산
+    rate_limit_config = merge_rate_limit_config(st.session_state.get("settings", {}))
+    rate_limit_key = (st.session_state.get("activity_code", ""), student_name, current_session_id())
+    remaining_budget = rate_limiter.remaining_budget(rate_limit_key, rate_limit_config)
+    if remaining_budget is not None:
+        st.caption(f"🎫 남은 AI 사용량: {remaining_budget:,} 토큰")
+
+    if images:
+        for column, image in zip(st.columns(min(len(images), 3)) * 2, images):
+            column.image(image, caption=image.name, use_column_width=True)
 
-    if image:
-        st.image(image, caption='선택된 이미지', use_column_width=True)
+        # 여러 장이면 한 번의 요청으로 함께 분석하거나, 이미지마다 따로 분석
+        per_image = len(images) > 1 and st.checkbox("🔍 이미지마다 따로 분석하기")
+        # 따로 분석하면 이미지 수만큼 요청하므로 한꺼번에 보낼 수 있는 요청 수(burst)까지만 사용
+        max_per_image = max(1, int(rate_limit_config["burst"]))
+        if per_image and len(images) > max_per_image:
+            st.warning(f"⚠️ 이미지마다 따로 분석할 때는 {max_per_image}장까지 분석할 수 있습니다. 앞의 {max_per_image}장만 사용합니다.")
+            images = images[:max_per_image]
 
-        try:
-            with st.spinner('🧠 AI가 이미지를 분석하여 창의적인 교육 활동을 도와줍니다...'):
-                # 이미지 바이트 문자열로 변환
-                img_bytes = image.read()
+        if st.button("🧠 AI 분석 시작", key="analyze_images"):
+            # 모델 호출 전에 요청 제한 확인 (호출할 요청 수만큼 한꺼번에, 모자라면 하나도 쓰지 않음)
+            allowed, limit_message = rate_limiter.acquire(rate_limit_key, rate_limit_config, cost=len(images) if per_image else 1)
+            if not allowed:
+                st.warning(limit_message)
+                st.stop()
 
-                # bytes 타입의 이미지 데이터를 PIL.Image.Image 객체로 변환
-                img = Image.open(io.BytesIO(img_bytes))
+            try:
+                # 스피너는 첫 조각이 도착할 때까지만 표시하고, 답변은 도착하는 대로 화면에 이어 씀
+                with st.spinner('🧠 AI가 이미지를 분석하여 창의적인 교육 활동을 도와줍니다...'):
+                    # 이미지들을 병렬로 읽고 크기 줄이기
+                    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+                        prepared = list(executor.map(preprocess_image, images))
 
-                model = genai.GenerativeModel('gemini-1.5-flash')
+                    # 활동별 대체 모델 목록 (모델 객체는 프로세스 전체에서 재사용)
+                    router_config = merge_router_config(st.session_state.get("settings", {}))
 
-                # Generate content
-                response = model.generate_content([
-                    st.session_state.prompt, img
-                ])
+                    # 겹쳐 보냈다가 결과를 버린 요청도 과금되므로 끝나면 사용량에 기록 (작업 스레드에서 호출됨)
+                    def record_discarded_usage(discarded, discarded_model):
+                        record_usage(rate_limit_key, "gemini", discarded_model.removeprefix("models/"), discarded)
 
-                # Resolve the response
-                response.resolve()
+                    if per_image:
+                        # 이미지마다 따로 요청하되 동시 요청 수 제한
+                        prompt = st.session_state.prompt  # 작업 스레드에서는 세션 상태를 읽지 않음
+                        deadline_config = merge_deadline_config(st.session_state.get("settings", {}), "vision.analyze")
 
-                ai_response_text = response.text
-                st.markdown(ai_response_text)
+                        def analyze(item):
+                            response, model_name = model_router.generate(
+                                [prompt, item[2]], router_config, deadline_config, on_discard=record_discarded_usage,
+                            )
+                            return response_text(response, rate_limit_key, model_name)
 
-                # 결과와 이미지를 교사에게 이메일로 전송
-                if send_email_to_teacher(student_name, st.session_state.teacher_email, st.session_state.prompt, img_bytes, ai_response_text):
+                        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+                            answers = list(executor.map(analyze, prepared))
+                        ai_response_text = "\n\n".join(
+                            f"**이미지 {index} ({item[0]})**\n\n{answer}"
+                            for index, (item, answer) in enumerate(zip(prepared, answers), start=1)
+                        )
+                    else:
+                        # 모든 이미지를 한 번의 스트리밍 요청으로 함께 분석 (첫 조각이 오면 반환됨)
+                        contents = [st.session_state.prompt]
+                        for index, item in enumerate(prepared, start=1):
+                            if len(prepared) > 1:
+                                contents.append(f"이미지 {index}:")
+                            contents.append(item[2])
+                        deadline_config = merge_deadline_config(st.session_state.get("settings", {}), "vision.stream")
+                        chunks, response, model_name = model_router.stream(
+                            contents, router_config, deadline_config, on_discard=record_discarded_usage,
+                        )
+
+                if per_image:
+                    st.markdown(ai_response_text)
+                else:
+                    # 전체 텍스트는 이메일과 보관함에 사용
+                    ai_response_text = st.write_stream(stream_text(chunks, response, rate_limit_key, model_name))
+
+                # 결과와 원본 이미지는 보관함에 두고, 교사에게는 결과 번호와 AI 결과만 이메일로 전송
+                result_id = archive_result(
+                    "vision", st.session_state.get("activity_code", ""), student_name, st.session_state.prompt,
+                    "", ai_response_text, [img_bytes for _, img_bytes, _ in prepared],
+                )
+                if send_email_to_teacher(student_name, st.session_state.teacher_email, result_id, len(prepared), ai_response_text):
                     if st.session_state.teacher_email:
                         st.success("📧 교사에게 이메일로 결과가 전송되었습니다.")
-        except UnidentifiedImageError:
-            st.error("❌ 업로드된 파일이 유효한 이미지 파일이 아닙니다. 다른 파일을 업로드해 주세요.")
+            except UnidentifiedImageError:
+                st.error("❌ 업로드된 파일이 유효한 이미지 파일이 아닙니다. 다른 파일을 업로드해 주세요.")
+            except Exception as e:
+                st.error(f"AI 분석 중 오류가 발생했습니다. {friendly_error(e)}")
 else:
     st.info("프롬프트를 가져오세요.")
@@ -1,9 +1,20 @@
 import streamlit as st
 from openai import OpenAI
-import requests
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from utils.prefilter import merge_prefilter_config, check_student_input
+from utils.static_assets import style_tag
+from utils.rate_limit import merge_rate_limit_config, rate_limiter, current_session_id
+from utils.prefetch import start_prefetch, resolve_activity
+from utils.notion_records import ActivitySchema, thaw
+from utils.notion_client import query_activity
+from utils.usage import record_usage
+from utils.hedge import merge_deadline_config
+from utils.llm_backends import chat_backends, complete_chat
+from utils.replay import wrap_openai_client
+from utils.circuit_breaker import friendly_error
+from utils.mailer import send_or_queue
+from utils.archive import archive_result
 
 # 페이지 설정 - 아이콘과 제목 설정
 st.set_page_config(
@@ -11,105 +22,28 @@ st.set_page_config(
     page_icon="🤖",  # 브라우저 탭에 표시될 아이콘 (이모지 또는 이미지 파일 경로)
 )
 
-# Streamlit의 배경색 변경
-background_color = "#FFFACD"
-
-# 배경색 변경을 위한 CSS
-page_bg_css = f"""
-<style>
-    .stApp {{
-        background-color: {background_color};
-    }}
-</style>
-"""
-
-# Streamlit의 기본 메뉴와 푸터 숨기기
-hide_menu_style = """
-    <style>
-    #MainMenu {visibility: hidden; }
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-    <script>
-    document.addEventListener("DOMContentLoaded", function() {
-        var mainMenu = document.getElementById('MainMenu');
-        if (mainMenu) {
-            mainMenu.style.display = 'none';
-        }
-        var footer = document.getElementsByTagName('footer')[0];
-        if (footer) {
-            footer.style.display = 'none';
-        }
-        var header = document.getElementsByTagName('header')[0];
-        if (header) {
-            header.style.display = 'none';
-        }
-    });
-    </script>
-"""
-
-# Streamlit에서 HTML 및 CSS 적용
-st.markdown(hide_menu_style, unsafe_allow_html=True)
-st.markdown(page_bg_css, unsafe_allow_html=True)
+# Streamlit의 기본 메뉴와 푸터 숨기기, 배경색 변경 (static/의 CSS를 프로세스마다 한 번만 만들어 재사용)
+st.markdown(style_tag("hide_menu.css", "text_gen.css"), unsafe_allow_html=True)
 
 # OpenAI API 클라이언트 초기화
-client = OpenAI(api_key=st.secrets["api"]["keys"][0])
+api_keys = [key for key in st.secrets["api"]["keys"] if key]
+client = wrap_openai_client(OpenAI(api_key=api_keys[0]))
+# 늦어질 때 겹쳐 보내는 요청용 클라이언트 (키가 여러 개면 다른 키 사용)
+hedge_client = wrap_openai_client(OpenAI(api_key=api_keys[1])) if len(api_keys) > 1 else client
 
 # Notion API를 통해 프롬프트와 교사 이메일 가져오기
-NOTION_API_URL = "https://api.notion.com/v1/databases/{database_id}/query"
 NOTION_API_KEY = st.secrets["notion"]["api_key"]
 DATABASE_ID = st.secrets["notion"]["database_id_text"]
-headers = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Content-Type": "application/json",
-    "Notion-Version": "2022-06-28"
-}
+# 이 페이지에 필요한 노션 속성 (프롬프트와 학생용 안내는 반드시 있어야 함)
+ACTIVITY_SCHEMA = ActivitySchema(required=("prompt", "student_view"))
 
 def fetch_prompt_email_student_view(activity_code):
-    query_payload = {
-        "filter": {
-            "property": "activity_code",
-            "rich_text": {
-                "equals": activity_code
-            }
-        }
-    }
-    response = requests.post(NOTION_API_URL.format(database_id=DATABASE_ID), headers=headers, json=query_payload)
-    data = response.json()
-
-    # 디버깅을 위해 응답 데이터 출력 (개발 중에만 사용)
-    # st.write("Notion API 응답 데이터:", data)
-
-    if "results" in data and len(data["results"]) > 0:
-        for result in data["results"]:
-            properties = result.get("properties", {})
-            
-            prompt_property = properties.get("prompt", {})
-            student_view_property = properties.get("student_view", {})
-            email_property = properties.get("email", {})
-            
-            # 'prompt' 속성에서 텍스트 콘텐츠 가져오기
-            prompt_rich_text = prompt_property.get("rich_text", [])
-            if not prompt_rich_text:
-                continue
-            prompt = prompt_rich_text[0].get("text", {}).get("content", "")
-            
-            # 'student_view' 속성에서 텍스트 콘텐츠 가져오기
-            student_view_rich_text = student_view_property.get("rich_text", [])
-            if not student_view_rich_text:
-                continue
-            student_view = student_view_rich_text[0].get("text", {}).get("content", "")
-            
-            # 'email' 속성에서 plain_text 가져오기 (선택 사항)
-            email_rich_text = email_property.get("rich_text", [])
-            teacher_email = ""
-            if email_rich_text:
-                teacher_email = email_rich_text[0].get("plain_text", "")
-            
-            return prompt, student_view, teacher_email
-    return None, None, None
-
-def send_email_to_teacher(student_name, teacher_email, prompt, student_answer, ai_answer):
+    record = query_activity(NOTION_API_KEY, DATABASE_ID, activity_code, ACTIVITY_SCHEMA)
+    if record is None:
+        return None, None, None, {}, []
+    return record.prompt, record.student_view, record.teacher_email, thaw(record.settings), list(record.problems)
+
+def send_email_to_teacher(student_name, teacher_email, result_id, student_answer, ai_answer):
     if not teacher_email:
         st.info("⚠️ 교사 이메일이 설정되어 있지 않아 이메일을 전송하지 않습니다.")
         return False  # 이메일 전송 건너뜀
@@ -121,9 +55,7 @@ def send_email_to_teacher(student_name, teacher_email, prompt, student_answer, a
 
     body = f"""
     학생 이름: {student_name}
-    
-    사용된 프롬프트:
-    {prompt}
+    결과 번호: {result_id or "보관 실패"} (프롬프트는 교사용 관리 페이지의 결과 보관함에서 볼 수 있습니다)
 
     학생의 입력:
     {student_answer}
@@ -133,14 +65,15 @@ def send_email_to_teacher(student_name, teacher_email, prompt, student_answer, a
     """
     msg.attach(MIMEText(body, "plain"))
 
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(st.secrets["email"]["address"], st.secrets["email"]["password"])
-            server.send_message(msg)
-        return True  # 이메일 전송 성공
-    except Exception as e:
-        st.error(f"이메일 전송에 실패했습니다: {e}")
-        return False  # 이메일 전송 실패
+    # 메일 서버에 연결할 수 없으면 보관해 두었다가 나중에 전송
+    status = send_or_queue(msg, st.secrets["email"]["address"], st.secrets["email"]["password"])
+    if status == "queued":
+        st.info("📮 메일 서버에 연결할 수 없어 결과를 보관해 두었습니다. 연결되면 교사에게 자동으로 전송됩니다.")
+        return False
+    if status == "rejected":
+        st.warning("⚠️ 메일 서버가 메일을 거부하여 결과를 전송하지 못했습니다. 선생님께 이메일 주소를 확인해 달라고 말씀드리세요.")
+        return False
+    return True  # 이메일 전송 성공
 
 # 학생용 UI
 st.header('🎓 학생용: 인공지능 대화 생성 도구')
@@ -160,18 +93,30 @@ student_name = st.text_input("🔑 학생 이름 입력", value="", max_chars=50
 if not student_name:
     st.warning("학생 이름을 입력하세요.")
 
+# 활동 코드 입력이 바뀌면 버튼을 누르기 전에 미리 노션 조회 시작
+def prefetch_activity():
+    start_prefetch(st.session_state, "text", st.session_state.activity_code_input, fetch_prompt_email_student_view)
+
 # 활동 코드 입력 필드
-activity_code = st.text_input("🔑 활동 코드 입력")
+activity_code = st.text_input("🔑 활동 코드 입력", key="activity_code_input", on_change=prefetch_activity)
 
 if st.button("📄 프롬프트 가져오기", key="get_prompt"):
     if activity_code:
         with st.spinner("🔍 프롬프트를 불러오는 중..."):
-            prompt, student_view, teacher_email = fetch_prompt_email_student_view(activity_code)
+            try:
+                prompt, student_view, teacher_email, settings, problems = resolve_activity(st.session_state, "text", activity_code, fetch_prompt_email_student_view)
+            except Exception as e:
+                st.error(friendly_error(e))
+                st.stop()
             if prompt and student_view:
                 st.session_state.prompt = prompt
                 st.session_state.student_view = student_view
                 st.session_state.teacher_email = teacher_email  # None 또는 빈 문자열일 수 있음
+                st.session_state.settings = settings
+                st.session_state.activity_code = activity_code
                 st.success("✅ 프롬프트를 성공적으로 불러왔습니다.")
+                for problem in problems:
+                    st.warning(f"⚠️ 노션 활동 설정의 일부를 읽지 못해 기본값을 사용합니다. 선생님께 알려 주세요. ({problem})")
             else:
                 st.error("⚠️ 활동 코드를 다시 확인하세요.")  # 코드 불러오기 실패 시 오류 메시지
     else:
@@ -182,12 +127,32 @@ if "prompt" in st.session_state and st.session_state.prompt and "student_view" i
 
     student_answer = st.text_area("📝 활동 입력", value=st.session_state.get("student_answer", ""))
 
+    # 학생별 요청 제한과 남은 토큰 예산
+    rate_limit_config = merge_rate_limit_config(st.session_state.get("settings", {}))
+    rate_limit_key = (st.session_state.get("activity_code", ""), student_name, current_session_id())
+    remaining_budget = rate_limiter.remaining_budget(rate_limit_key, rate_limit_config)
+    if remaining_budget is not None:
+        st.caption(f"🎫 남은 AI 사용량: {remaining_budget:,} 토큰")
+
     if st.button("🤖 AI 대화 생성", key="generate_answer"):
-        if student_answer:
+        # 모델 호출 전에 로컬 사전 필터로 의미 없는 입력 걸러내기
+        prefilter_config = merge_prefilter_config(st.session_state.get("settings", {}))
+        if "prefilter_history" not in st.session_state:
+            st.session_state.prefilter_history = []
+        passed, canned_response = check_student_input(student_answer, prefilter_config, st.session_state.prefilter_history)
+        if passed:
+            # 사전 필터를 통과한 입력만 요청 제한에 반영
+            passed, canned_response = rate_limiter.acquire(rate_limit_key, rate_limit_config)
+        if not student_answer:
+            st.error("⚠️ 활동을 입력하세요.")
+        elif not passed:
+            st.warning(canned_response)
+        else:
             with st.spinner("💬 AI가 대화를 생성하는 중..."):
                 st.session_state.student_answer = student_answer
                 try:
-                    response = client.chat.completions.create(
+                    deadline_config = merge_deadline_config(st.session_state.get("settings", {}), "text.generate")
+                    request = dict(
                         model="gpt-4o-mini",
                         messages=[
                             {
@@ -198,18 +163,30 @@ if "prompt" in st.session_state and st.session_state.prompt and "student_view" i
                                 )
                             },
                             {"role": "user", "content": student_answer}
-                        ]
+                        ],
+                        timeout=deadline_config["budget_seconds"],
                     )
-
+                    # 활동 설정의 대화 모델(OpenAI / 로컬)을 시간 제한 안에서 호출하고, 늦어지거나 실패하면 다음 모델 사용
+                    backends = chat_backends(st.session_state.get("settings", {}), client, hedge_client)
+                    # 겹쳐 보냈다가 결과를 버린 요청도 과금되므로 끝나면 사용량에 기록 (작업 스레드에서 호출됨)
+                    record_discarded = lambda discarded, other: record_usage(rate_limit_key, other.provider, other.model_name(request), discarded)
+                    response, backend = complete_chat("text.generate", backends, request, deadline_config, on_discard=record_discarded)
+
+                    if response.usage:
+                        rate_limiter.record_tokens(rate_limit_key, response.usage.total_tokens)
+                    record_usage(rate_limit_key, backend.provider, backend.model_name(request), response)
                     st.session_state.ai_answer = response.choices[0].message.content.strip()
                     st.write("💡 **AI 생성 대화:** " + st.session_state.ai_answer)
 
-                    if send_email_to_teacher(student_name, st.session_state.teacher_email, st.session_state.prompt, student_answer, st.session_state.ai_answer):
+                    # 결과는 보관함에 두고, 교사에게는 프롬프트를 뺀 결과만 이메일로 전송
+                    result_id = archive_result(
+                        "text", st.session_state.get("activity_code", ""), student_name, st.session_state.prompt,
+                        student_answer, st.session_state.ai_answer,
+                    )
+                    if send_email_to_teacher(student_name, st.session_state.teacher_email, result_id, student_answer, st.session_state.ai_answer):
                         if st.session_state.teacher_email:
                             st.success("📧 교사에게 이메일로 결과가 전송되었습니다.")
                 except Exception as e:
-                    st.error(f"AI 대화 생성 중 오류가 발생했습니다: {e}")
-        else:
-            st.error("⚠️ 활동을 입력하세요.")
+                    st.error(f"AI 대화 생성 중 오류가 발생했습니다. {friendly_error(e)}")
 else:
     st.info("프롬프트를 가져오세요.")
@@ -1,12 +1,20 @@
 import streamlit as st
 from openai import OpenAI
-import requests
 import pathlib
 import toml
-import json
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from utils.static_assets import style_tag
+from utils.rate_limit import merge_rate_limit_config, rate_limiter, current_session_id
+from utils.prefetch import start_prefetch, resolve_activity
+from utils.notion_records import ActivitySchema, thaw
+from utils.notion_client import query_activity
+from utils.usage import record_usage
+from utils.hedge import merge_deadline_config, run_hedged, OPENAI_RETRYABLE_ERRORS, HTTP_RETRYABLE_ERRORS
+from utils.replay import recorded_get, wrap_openai_client
+from utils.circuit_breaker import breakers, friendly_error, CircuitOpenError, OPENAI_OUTAGE_ERRORS
+from utils.mailer import send_or_queue
+from utils.archive import archive_result
 
 # 세션 상태 초기화
 if 'prompt' not in st.session_state:
@@ -17,6 +25,8 @@ if 'image_url' not in st.session_state:
     st.session_state.image_url = ""
 if 'adjectives' not in st.session_state:
     st.session_state.adjectives = []
+if 'settings' not in st.session_state:
+    st.session_state.settings = {}
 
 # 페이지 설정 - 아이콘과 제목 설정
 st.set_page_config(
@@ -24,46 +34,8 @@ st.set_page_config(
     page_icon="🤖",
 )
 
-# Streamlit의 배경색 변경
-background_color = "#FFEBEE"
-
-# 배경색 변경을 위한 CSS
-page_bg_css = f"""
-<style>
-    .stApp {{
-        background-color: {background_color};
-    }}
-</style>
-"""
-
-# Streamlit의 기본 메뉴와 푸터 숨기기
-hide_menu_style = """
-    <style>
-    #MainMenu {visibility: hidden; }
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-    <script>
-    document.addEventListener("DOMContentLoaded", function() {
-        var mainMenu = document.getElementById('MainMenu');
-        if (mainMenu) {
-            mainMenu.style.display = 'none';
-        }
-        var footer = document.getElementsByTagName('footer')[0];
-        if (footer) {
-            footer.style.display = 'none';
-        }
-        var header = document.getElementsByTagName('header')[0];
-        if (header) {
-            header.style.display = 'none';
-        }
-    });
-    </script>
-"""
-
-# Streamlit에서 HTML 및 CSS 적용
-st.markdown(hide_menu_style, unsafe_allow_html=True)
-st.markdown(page_bg_css, unsafe_allow_html=True)
+# Streamlit의 기본 메뉴와 푸터 숨기기, 배경색 변경 (static/의 CSS를 프로세스마다 한 번만 만들어 재사용)
+st.markdown(style_tag("hide_menu.css", "image_gen.css"), unsafe_allow_html=True)
 
 # secrets.toml 파일 경로
 secrets_path = pathlib.Path(__file__).parent.parent / ".streamlit/secrets.toml"
@@ -73,14 +45,19 @@ with open(secrets_path, "r") as f:
     secrets = toml.load(f)
 
 # OpenAI API 클라이언트 초기화
-client = OpenAI(api_key=secrets["api"]["keys"][0])  # 첫 번째 API 키 사용
+api_keys = [key for key in secrets["api"]["keys"] if key]
+client = wrap_openai_client(OpenAI(api_key=api_keys[0]))  # 첫 번째 API 키 사용
+# 늦어지거나 실패할 때 쓰는 요청용 클라이언트 (키가 여러 개면 다른 키 사용)
+hedge_client = wrap_openai_client(OpenAI(api_key=api_keys[1])) if len(api_keys) > 1 else client
 
 # Notion API 설정
 NOTION_API_KEY = secrets["notion"]["api_key"]
 NOTION_DATABASE_ID = secrets["notion"]["database_id_image"]
+# 이 페이지에 필요한 노션 속성 (프롬프트는 반드시 있어야 함)
+ACTIVITY_SCHEMA = ActivitySchema(required=("prompt",))
 
 # 이메일 전송 기능
-def send_email_to_teacher(student_name, teacher_email, prompt, adjectives, image_url):
+def send_email_to_teacher(student_name, teacher_email, prompt, adjectives, image_url, result_id):
     if not teacher_email:
         return False  # 이메일 전송 건너뜀
 
@@ -94,70 +71,30 @@ def send_email_to_teacher(student_name, teacher_email, prompt, adjectives, image
     주제: {prompt}
     형용사: {adjectives}
 
-    생성된 이미지 URL:
+    생성된 이미지 URL (약 1시간 뒤 만료):
     {image_url}
+
+    결과 번호: {result_id or "보관 실패"} (만료된 뒤에는 교사용 관리 페이지의 결과 보관함에서 볼 수 있습니다)
     """
     msg.attach(MIMEText(body, "plain"))
 
-    # 이메일 전송
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(secrets["email"]["address"], secrets["email"]["password"])
-            server.send_message(msg)
-        return True  # 이메일 전송 성공 시 True 반환
-    except Exception as e:
-        st.error(f"이메일 전송에 실패했습니다: {e}")
-        return False  # 이메일 전송 실패 시 False 반환
+    # 이메일 전송 (메일 서버에 연결할 수 없으면 보관해 두었다가 나중에 전송)
+    status = send_or_queue(msg, secrets["email"]["address"], secrets["email"]["password"])
+    if status == "queued":
+        st.info("📮 메일 서버에 연결할 수 없어 결과를 보관해 두었습니다. 연결되면 교사에게 자동으로 전송됩니다.")
+        return False
+    if status == "rejected":
+        st.warning("⚠️ 메일 서버가 메일을 거부하여 결과를 전송하지 못했습니다. 선생님께 이메일 주소를 확인해 달라고 말씀드리세요.")
+        return False
+    return True  # 이메일 전송 성공 시 True 반환
 
 # Notion에서 프롬프트와 형용사(adjective) 가져오기
 def get_prompt_and_adjectives(activity_code):
-    url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query"
-    headers = {
-        "Authorization": f"Bearer {NOTION_API_KEY}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28"
-    }
-    data = {
-        "filter": {
-            "property": "activity_code",
-            "rich_text": {
-                "equals": activity_code
-            }
-        }
-    }
-    response = requests.post(url, headers=headers, json=data)
-
-    if response.status_code == 200:
-        results = response.json().get("results")
-        if results:
-            for result in results:
-                # 프롬프트 가져오기
-                prompt_property = result["properties"].get("prompt", {})
-                prompt_rich_text = prompt_property.get("rich_text", [])
-                prompt = prompt_rich_text[0].get("text", {}).get("content", "") if prompt_rich_text else ""
-
-                # 교사 이메일 가져오기
-                email_property = result["properties"].get("email", {})
-                email_rich_text = email_property.get("rich_text", [])
-                teacher_email = email_rich_text[0].get("plain_text", "") if email_rich_text else ""
-
-                # 형용사 가져오기 (JSON 문자열 파싱)
-                adjectives_property = result["properties"].get("adjectives", {})
-                adjectives = []
-                if adjectives_property.get("rich_text"):
-                    adjectives_str = adjectives_property["rich_text"][0]["text"]["content"]
-                    try:
-                        adjectives = json.loads(adjectives_str)  # JSON 문자열을 리스트로 변환
-                    except json.JSONDecodeError:
-                        st.error("⚠️ 형용사를 파싱하는 중 오류가 발생했습니다.")
-
-                # 세션 상태에 프롬프트와 형용사 저장
-                st.session_state.prompt = prompt
-                st.session_state.teacher_email = teacher_email
-                st.session_state.adjectives = adjectives
-
-                return prompt, teacher_email, adjectives
-    return None, None, []
+    # 형용사(JSON 목록)는 조회할 때 한 번만 읽어 두고, 세션 상태 저장은 호출한 쪽에서 처리
+    record = query_activity(NOTION_API_KEY, NOTION_DATABASE_ID, activity_code, ACTIVITY_SCHEMA)
+    if record is None:
+        return None, None, [], {}, []
+    return record.prompt, record.teacher_email, list(record.adjectives), thaw(record.settings), list(record.problems)
 
 # 학생용 UI
 st.header('🎨 학생용: 이미지 생성 도구')
@@ -178,19 +115,31 @@ student_name = st.text_input("🔑 학생 이름 입력", value="", max_chars=50
 if not student_name:
     st.warning("학생 이름을 입력하세요.")
 
+# 활동 코드 입력이 바뀌면 버튼을 누르기 전에 미리 노션 조회 시작
+def prefetch_activity():
+    start_prefetch(st.session_state, "image", st.session_state.activity_code_input, get_prompt_and_adjectives)
+
 # 활동 코드 입력 필드
-activity_code = st.text_input("🔑 코드 입력")
+activity_code = st.text_input("🔑 코드 입력", key="activity_code_input", on_change=prefetch_activity)
 
 if st.button("📄 프롬프트 가져오기", key="get_prompt"):
     if activity_code:
         with st.spinner("🔍 프롬프트를 불러오는 중..."):
-            prompt, teacher_email, adjectives = get_prompt_and_adjectives(activity_code)
+            try:
+                prompt, teacher_email, adjectives, settings, problems = resolve_activity(st.session_state, "image", activity_code, get_prompt_and_adjectives)
+            except Exception as e:
+                st.error(friendly_error(e))
+                st.stop()
 
             if prompt:
                 st.session_state.prompt = prompt
                 st.session_state.teacher_email = teacher_email  # 빈 문자열일 수 있음
                 st.session_state.adjectives = adjectives
+                st.session_state.settings = settings
+                st.session_state.activity_code = activity_code
                 st.success("✅ 프롬프트를 성공적으로 불러왔습니다.")
+                for problem in problems:
+                    st.warning(f"⚠️ 노션 활동 설정의 일부를 읽지 못해 기본값을 사용합니다. 선생님께 알려 주세요. ({problem})")
             else:
                 st.error("⚠️ 해당 코드에 대한 프롬프트를 찾을 수 없습니다.")
     else:
@@ -211,24 +160,50 @@ if st.session_state.prompt:
     else:
         st.error("⚠️ 형용사를 불러올 수 없습니다.")
 
+    # 학생별 요청 제한
+    rate_limit_config = merge_rate_limit_config(st.session_state.settings)
+    rate_limit_key = (st.session_state.get("activity_code", ""), student_name, current_session_id())
+
     if selected_adjective:
         if st.button("🖼️ 이미지 생성", key="generate_image"):
+            allowed, limit_message = rate_limiter.acquire(rate_limit_key, rate_limit_config)
+            if not allowed:
+                st.warning(limit_message)
+                st.stop()
+
             with st.spinner("🖼️ 이미지를 생성하는 중..."):
                 combined_prompt = f"{st.session_state.prompt} {selected_adjective}"
                 try:
-                    response = client.images.generate(
+                    settings = st.session_state.settings
+                    deadline_config = merge_deadline_config(settings, "image.generate")
+                    request = dict(
                         model="dall-e-3",
                         prompt=combined_prompt,
                         size="1024x1024",
                         quality="standard",
                         n=1,
+                        timeout=deadline_config["budget_seconds"],
                     )
+                    # 시간 제한 안에서 호출 (이미지 생성은 기본적으로 겹쳐 보내지 않고, 오류가 나면 다른 키로 재시도)
+                    # OpenAI 차단기가 열려 있으면 기다리지 않고 바로 실패
+                    generate = lambda c: breakers["openai"].call(lambda: c.images.generate(**request), OPENAI_OUTAGE_ERRORS)
+                    response, _ = run_hedged("image.generate", [
+                        ("primary", lambda: generate(client)),
+                        ("hedge", lambda: generate(hedge_client)),
+                    ], deadline_config, OPENAI_RETRYABLE_ERRORS + (CircuitOpenError,),
+                       on_discard=lambda name, discarded: record_usage(rate_limit_key, "openai", "dall-e-3", images=1))  # 버린 요청도 과금됨
+                    record_usage(rate_limit_key, "openai", "dall-e-3", images=1)
                     image_url = response.data[0].url
                     st.session_state.image_url = image_url
                     st.image(image_url, caption="생성된 이미지", use_column_width=True)
 
                     # 이미지 데이터를 바이너리로 가져오기
-                    image_response = requests.get(image_url)
+                    download_config = merge_deadline_config(settings, "image.download")
+                    download = lambda: recorded_get(image_url, timeout=download_config["budget_seconds"])
+                    image_response, _ = run_hedged("image.download", [
+                        ("primary", download),
+                        ("hedge", download),
+                    ], download_config, HTTP_RETRYABLE_ERRORS)
                     if image_response.status_code == 200:
                         image_data = image_response.content
                         st.success("✅ 이미지가 성공적으로 생성되었습니다!")
@@ -238,14 +213,18 @@ if st.session_state.prompt:
                             file_name="generated_image.png",
                             mime="image/png"
                         )
-                        # 이메일로 결과 전송
-                        if send_email_to_teacher(student_name, st.session_state.teacher_email, st.session_state.prompt, selected_adjective, image_url):
+                        # 이미지는 줄여서 보관함에 두고, 이메일로 결과 전송
+                        result_id = archive_result(
+                            "image", st.session_state.get("activity_code", ""), student_name, st.session_state.prompt,
+                            selected_adjective, image_url, [image_data],
+                        )
+                        if send_email_to_teacher(student_name, st.session_state.teacher_email, st.session_state.prompt, selected_adjective, image_url, result_id):
                             if st.session_state.teacher_email:
                                 st.success("📧 교사에게 이메일로 결과가 전송되었습니다.")
                     else:
                         st.error("이미지를 가져오는 중 오류가 발생했습니다.")
 
                 except Exception as e:
-                    st.error(f"이미지 생성에 실패했습니다: {e}")
+                    st.error(f"이미지 생성에 실패했습니다. {friendly_error(e)}")
 else:
     st.info("프롬프트를 가져와 주세요.")
@@ -2,13 +2,26 @@ import openai
 from openai import OpenAI
 import streamlit as st
 import random
-import requests
 import pathlib
 import toml
-import json
-import smtplib
+import io
+import gzip
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+from utils.static_assets import style_tag
+from utils.prefilter import merge_prefilter_config, check_student_input
+from utils.rate_limit import merge_rate_limit_config, rate_limiter, current_session_id
+from utils.prefetch import start_prefetch, resolve_activity
+from utils.notion_records import ActivitySchema, thaw
+from utils.notion_client import query_activity
+from utils.usage import record_usage
+from utils.hedge import merge_deadline_config
+from utils.llm_backends import chat_backends, complete_chat
+from utils.replay import wrap_openai_client
+from utils.circuit_breaker import friendly_error
+from utils.mailer import send_or_queue
+from utils.archive import archive_result
 
 # 세션 상태 초기화
 if 'prompt' not in st.session_state:
@@ -26,59 +39,13 @@ st.set_page_config(
     page_icon="🤖",  # 브라우저 탭에 표시될 아이콘 (이모지 또는 이미지 파일 경로)
 )
 
-# 배경색 변경을 위한 CSS 로드 함수
+# 배경색 변경과 기본 메뉴 숨기기 CSS 로드 함수
+# static/ 폴더의 CSS를 프로세스마다 한 번만 줄여서 만들어 두고, 매 실행마다 작은 <style> 태그 하나만 보냄
+# (Streamlit은 다시 실행될 때 그리지 않은 요소를 지우므로 매 실행마다 보내야 스타일이 유지됩니다.)
 def load_css():
-    css = """
-    <style>
-        body, .stApp, .stChatFloatingInputContainer {
-            background-color: #F0FFF0 !important; /* 전체 배경을 Honeydew로 설정 */
-        }
-        .stChatInputContainer {
-            background-color: #F0FFF0 !important; /* 입력 필드 주변 배경도 동일한 색으로 변경 */
-        }
-        textarea {
-            background-color: #FFFFFF !important; /* 실제 입력 필드는 흰색으로 설정 */
-        }
-        /* 누적 스크롤을 위한 chat-container 스타일 추가 */
-        .chat-container {
-            max-height: 500px; /* 원하는 높이로 조정 가능 */
-            overflow-y: auto;
-            padding: 10px;
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            background-color: #FFFFFF;
-            margin-bottom: 20px;
-        }
-    </style>
-    """
-    st.markdown(css, unsafe_allow_html=True)
+    st.markdown(style_tag("hide_menu.css", "chatbot.css"), unsafe_allow_html=True)
 
-# 배경색과 기본 메뉴 숨기기 설정
-hide_menu_style = """
-    <style>
-    #MainMenu {visibility: hidden; }
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    </style>
-    <script>
-    document.addEventListener("DOMContentLoaded", function() {
-        var mainMenu = document.getElementById('MainMenu');
-        if (mainMenu) {
-            mainMenu.style.display = 'none';
-        }
-        var footer = document.getElementsByTagName('footer')[0];
-        if (footer) {
-            footer.style.display = 'none';
-        }
-        var header = document.getElementsByTagName('header')[0];
-        if (header) {
-            header.style.display = 'none';
-        }
-    });
-    </script>
-"""
 # CSS 적용
-st.markdown(hide_menu_style, unsafe_allow_html=True)
 load_css()  # CSS 로드 함수 호출
 
 # secrets.toml 파일 경로
@@ -95,95 +62,98 @@ api_keys = [key for key in api_keys if key]  # None 값 제거
 if api_keys:
     selected_api_key = random.choice(api_keys)
     openai.api_key = selected_api_key  # OpenAI API 키 설정
-    client = OpenAI(api_key=selected_api_key)  # 클라이언트 초기화
+    client = wrap_openai_client(OpenAI(api_key=selected_api_key))  # 클라이언트 초기화
+    # 늦어질 때 겹쳐 보내는 요청용 클라이언트 (키가 여러 개면 다른 키 사용)
+    other_api_keys = [key for key in api_keys if key != selected_api_key]
+    hedge_client = wrap_openai_client(OpenAI(api_key=random.choice(other_api_keys))) if other_api_keys else client
 else:
     st.error("사용 가능한 OpenAI API 키가 없습니다.")
     st.stop()
 
 # 노션 API 설정
-NOTION_API_URL = "https://api.notion.com/v1/databases/{database_id}/query"
 NOTION_API_KEY = secrets["notion"]["api_key"]
 DATABASE_ID_CHATBOT = secrets["notion"]["database_id_chatbot"]
+# 이 페이지에 필요한 노션 속성 (학생용 안내가 없으면 기본 제목 사용)
+ACTIVITY_SCHEMA = ActivitySchema(required=("prompt",), defaults={"student_view": "🤖 학생용: 챗봇 도구"})
 
-headers = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Content-Type": "application/json",
-    "Notion-Version": "2022-06-28"
-}
+# 이 크기(바이트)를 넘는 대화 기록은 gzip으로 압축하여 첨부
+TRANSCRIPT_GZIP_THRESHOLD = 20000
 
-# 이메일 전송 기능
-def send_email(chat_history, student_name, teacher_email):
-    if not teacher_email:
-        return False  # 이메일 전송 건너뜀
+# 대화 기록을 문자열 이어 붙이기 대신 버퍼에 차례로 기록 (교사 프롬프트인 시스템 메시지는 제외)
+def write_transcript(writer, chat_history, start_index=0):
+    for msg_entry in chat_history[start_index:]:
+        if msg_entry["role"] == "system":
+            continue
+        role = "학생" if msg_entry["role"] == "user" else "챗봇"
+        writer.write(role)
+        writer.write(": ")
+        writer.write(msg_entry["content"])
+        writer.write("\n")
+
+# start_index 이후의 대화(아직 보관하지 않은 부분)를 결과 보관함에 저장
+def archive_transcript(chat_history, student_name, start_index):
+    transcript = io.StringIO()
+    write_transcript(transcript, chat_history, start_index)
+    if not transcript.getvalue():
+        return None
+    return archive_result(
+        "chatbot", st.session_state.activity_code, student_name, chat_history[0]["content"],
+        transcript.getvalue(), "",
+    )
+
+# 이메일 전송 기능 (start_index 이후의 대화만 전송, final이면 처음부터 전체 대화 전송)
+def send_email(chat_history, student_name, teacher_email, start_index=0, final=False, result_id=None):
+    if final:
+        start_index = 0
+    transcript = io.StringIO()
+    write_transcript(transcript, chat_history, start_index)
+    if not teacher_email or not transcript.getvalue():
+        return None  # 이메일 전송 건너뜀
+    transcript_bytes = transcript.getvalue().encode("utf-8")
+
+    if final:
+        subject_suffix = "대화 마침 - 전체 대화 기록"
+    else:
+        # 숨겨진 시스템 메시지(0번)는 세지 않으므로 목록의 번호가 곧 학생에게 보이는 순서
+        subject_suffix = f"대화 기록 ({start_index}~{len(chat_history) - 1}번째 메시지)"
 
     msg = MIMEMultipart()
     msg["From"] = secrets["email"]["address"]
     msg["To"] = teacher_email
-    msg["Subject"] = f"{student_name} 학생의 챗봇 대화 기록"
-
-    body = f"학생 이름: {student_name}\n\n대화 기록:\n\n"
-    for msg_entry in chat_history:
-        role = "학생" if msg_entry["role"] == "user" else "챗봇"
-        body += f"{role}: {msg_entry['content']}\n"
+    msg["Subject"] = f"{student_name} 학생의 챗봇 {subject_suffix}"
 
-    msg.attach(MIMEText(body, "plain"))
+    if final:
+        # 앞부분은 이미 나누어 보관했으므로 결과 번호는 마지막 부분의 번호
+        archive_note = f"마지막 부분의 결과 번호: {result_id or '보관 실패'} (앞부분은 앞서 보낸 이메일의 결과 번호로 결과 보관함에서 볼 수 있습니다)"
+    else:
+        archive_note = f"결과 번호: {result_id or '보관 실패'} (교사용 관리 페이지의 결과 보관함에서도 볼 수 있습니다)"
+    header = f"학생 이름: {student_name}\n{archive_note}\n\n대화 기록:\n\n"
+    if len(transcript_bytes) > TRANSCRIPT_GZIP_THRESHOLD:
+        # 긴 대화는 본문 대신 압축 파일로 첨부
+        msg.attach(MIMEText(header + "대화 기록이 길어 첨부 파일(transcript.txt.gz)로 보냅니다.\n", "plain"))
+        attachment = MIMEApplication(gzip.compress(transcript_bytes), Name="transcript.txt.gz")
+        attachment.add_header("Content-Disposition", "attachment", filename="transcript.txt.gz")
+        msg.attach(attachment)
+    else:
+        msg.attach(MIMEText(header + transcript.getvalue(), "plain"))
 
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(secrets["email"]["address"], secrets["email"]["password"])
-            server.send_message(msg)
-        return True  # 이메일 전송 성공
-    except Exception as e:
-        st.error(f"이메일 전송에 실패했습니다: {e}")
-        return False  # 이메일 전송 실패
+    # 메일 서버에 연결할 수 없으면 보관해 두었다가 나중에 전송 ("sent", "rejected" 또는 "queued" 반환)
+    return send_or_queue(msg, secrets["email"]["address"], secrets["email"]["password"])
 
 # Notion에서 프롬프트와 교사 이메일, 학생 뷰 가져오기
 def fetch_instruction_from_notion(activity_code):
-    try:
-        instruction_api_url = NOTION_API_URL.format(database_id=DATABASE_ID_CHATBOT)
-        instruction_query_payload = {
-            "filter": {
-                "property": "activity_code",
-                "rich_text": {
-                    "equals": activity_code
-                }
-            }
-        }
-        response = requests.post(instruction_api_url, headers=headers, json=instruction_query_payload)
-        response.raise_for_status()  # HTTP 오류 발생 시 예외 발생
-        data = response.json()
-        
-        if "results" in data and len(data["results"]) > 0:
-            properties = data["results"][0]["properties"]
-            if "prompt" in properties and properties["prompt"]["rich_text"]:
-                instruction = properties["prompt"]["rich_text"][0]["text"]["content"]
-            else:
-                instruction = ""
-            
-            if "email" in properties and properties["email"]["rich_text"]:
-                teacher_email = properties["email"]["rich_text"][0]["text"]["content"]
-            else:
-                teacher_email = ""
-            
-            if "student_view" in properties and properties["student_view"]["rich_text"]:
-                student_view = properties["student_view"]["rich_text"][0]["text"]["content"]
-            else:
-                student_view = "🤖 학생용: 챗봇 도구"  # 기본 제목
-            
-            return instruction, teacher_email, student_view
-        else:
-            st.sidebar.error("해당 Activity 코드를 노션에서 찾을 수 없습니다.")
-            return None, None, None
-    except requests.exceptions.RequestException as e:
-        st.sidebar.error(f"노션 API 호출 중 오류가 발생했습니다: {e}")
-        return None, None, None
-    except Exception as e:
-        st.sidebar.error(f"데이터 처리 중 오류가 발생했습니다: {e}")
-        return None, None, None
+    record = query_activity(NOTION_API_KEY, DATABASE_ID_CHATBOT, activity_code, ACTIVITY_SCHEMA)
+    if record is None:
+        return None, None, None, {}, []
+    return record.prompt, record.teacher_email, record.student_view, thaw(record.settings), list(record.problems)
+
+# 활동 코드 입력이 바뀌면 버튼을 누르기 전에 미리 노션 조회 시작
+def prefetch_activity():
+    start_prefetch(st.session_state, "chatbot", st.session_state.activity_code_input, fetch_instruction_from_notion)
 
 def main():
     st.sidebar.header("활동 코드 및 학생 이름 입력")
-    activity_code = st.sidebar.text_input("활동 코드 입력", value="", max_chars=50)
+    activity_code = st.sidebar.text_input("활동 코드 입력", value="", max_chars=50, key="activity_code_input", on_change=prefetch_activity)
     student_name = st.sidebar.text_input("🔑 학생 이름 입력", value="", max_chars=50)
     
     if activity_code and student_name:
@@ -199,13 +169,21 @@ def main():
         st.session_state.teacher_email = ""
         st.session_state.student_view = "🤖 학생용: 챗봇 도구"
         st.session_state.last_email_count = 0
+        st.session_state.last_email_index = 1  # 시스템 메시지 다음부터 전송
+        st.session_state.settings = {}
+        st.session_state.prefilter_history = []
+        st.session_state.activity_code = ""
     
     # fetch_prompt_btn이 눌렸을 때 시스템 메시지 설정 부분
     if fetch_prompt_btn:
         if not activity_code or not student_name:
             st.sidebar.error("활동 코드와 학생 이름을 모두 입력해주세요.")
         else:
-            instruction, teacher_email, student_view = fetch_instruction_from_notion(activity_code)
+            try:
+                instruction, teacher_email, student_view, settings, problems = resolve_activity(st.session_state, "chatbot", activity_code, fetch_instruction_from_notion)
+            except Exception as e:
+                st.sidebar.error(friendly_error(e))
+                instruction = None
             if instruction:
                 # 시스템 메시지에 차단 지침 추가
                 system_content = (
@@ -213,16 +191,48 @@ def main():
                     "학생의 입력이 설정된 역할과 관련이 없거나 이상한 내용이 포함되어 있다면, 그 내용에 대해 응답하지 말고 주어진 역할에 집중해 주세요."
                 )
                 st.session_state.messages = [{"role": "system", "content": system_content}]
+                st.session_state.last_email_count = 0
+                st.session_state.last_email_index = 1
+                st.session_state.last_result_id = None
                 st.session_state.teacher_email = teacher_email
                 st.session_state.student_view = student_view
+                st.session_state.settings = settings
+                st.session_state.activity_code = activity_code
                 st.session_state.initialized = True
                 st.sidebar.success("프롬프트가 성공적으로 불러와졌습니다.")
+                for problem in problems:
+                    st.sidebar.warning(f"⚠️ 노션 활동 설정의 일부를 읽지 못해 기본값을 사용합니다. 선생님께 알려 주세요. ({problem})")
             else:
                 st.sidebar.error("프롬프트를 불러오지 못했습니다.")
 
     st.title(st.session_state.student_view)
     
     if st.session_state.initialized:
+        # 학생별 요청 제한과 남은 토큰 예산
+        rate_limit_config = merge_rate_limit_config(st.session_state.settings)
+        rate_limit_key = (st.session_state.activity_code, student_name, current_session_id())
+        remaining_budget = rate_limiter.remaining_budget(rate_limit_key, rate_limit_config)
+        if remaining_budget is not None:
+            st.sidebar.caption(f"🎫 남은 AI 사용량: {remaining_budget:,} 토큰")
+
+        # 대화를 마치면 아직 보관하지 않은 부분만 보관하고, 이메일로는 전체 대화를 한 번에 전송한 뒤 새 대화를 준비
+        if st.sidebar.button("🏁 대화 마치기"):
+            result_id = archive_transcript(st.session_state.messages, student_name, st.session_state.last_email_index)
+            result_id = result_id or st.session_state.get("last_result_id")  # 새로 보관할 대화가 없으면 마지막으로 보관한 번호
+            status = send_email(st.session_state.messages, student_name, st.session_state.teacher_email, final=True, result_id=result_id)
+            if status == "sent":
+                st.sidebar.success("대화 내역이 이메일로 전송되었습니다.")
+            elif status == "queued":
+                st.sidebar.info("📮 메일 서버에 연결할 수 없어 대화 내역을 보관해 두었습니다. 연결되면 교사에게 자동으로 전송됩니다.")
+            elif status == "rejected":
+                st.sidebar.warning("⚠️ 메일 서버가 메일을 거부하여 대화 내역을 전송하지 못했습니다. 선생님께 이메일 주소를 확인해 달라고 말씀드리세요.")
+            st.session_state.messages = []
+            st.session_state.initialized = False
+            st.session_state.last_email_count = 0
+            st.session_state.last_email_index = 1
+            st.session_state.last_result_id = None
+            st.stop()
+
         # 누적 스크롤을 위한 chat-container div 시작
         st.markdown('<div class="chat-container">', unsafe_allow_html=True)
         for msg in st.session_state.messages:
@@ -237,33 +247,62 @@ def main():
         # chat-container div 끝
         
         if prompt := st.chat_input("메시지를 입력하세요"):
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            # st.chat_message("user").write(prompt)  # 기존의 개별 메시지 표시 제거
-    
+            # 모델 호출 전에 로컬 사전 필터로 의미 없는 입력 걸러내기
+            prefilter_config = merge_prefilter_config(st.session_state.settings)
+            passed, canned_response = check_student_input(prompt, prefilter_config, st.session_state.prefilter_history)
+            if passed:
+                # 사전 필터를 통과한 입력만 요청 제한에 반영
+                passed, canned_response = rate_limiter.acquire(rate_limit_key, rate_limit_config)
+
+            if not passed:
+                # 걸러진 대화는 화면과 기록에만 남기고 모델에는 보내지 않음
+                st.session_state.messages.append({"role": "user", "content": prompt, "filtered": True})
+                st.session_state.messages.append({"role": "assistant", "content": canned_response, "filtered": True})
+            else:
+                st.session_state.messages.append({"role": "user", "content": prompt})
+                # st.chat_message("user").write(prompt)  # 기존의 개별 메시지 표시 제거
+
+                with st.spinner("응답을 기다리는 중..."):
+                    try:
+                        deadline_config = merge_deadline_config(st.session_state.settings, "chatbot.reply")
+                        request = dict(
+                            model="gpt-4o-mini",
+                            messages=[
+                                {"role": m["role"], "content": m["content"]}
+                                for m in st.session_state.messages if not m.get("filtered")
+                            ],
+                            timeout=deadline_config["budget_seconds"],
+                        )
+                        # 활동 설정의 대화 모델(OpenAI / 로컬)을 시간 제한 안에서 호출하고, 늦어지거나 실패하면 다음 모델 사용
+                        backends = chat_backends(st.session_state.settings, client, hedge_client)
+                        # 겹쳐 보냈다가 결과를 버린 요청도 과금되므로 끝나면 사용량에 기록 (작업 스레드에서 호출됨)
+                        record_discarded = lambda discarded, other: record_usage(rate_limit_key, other.provider, other.model_name(request), discarded)
+                        response, backend = complete_chat("chatbot.reply", backends, request, deadline_config, on_discard=record_discarded)
+                        if response.usage:
+                            rate_limiter.record_tokens(rate_limit_key, response.usage.total_tokens)
+                        record_usage(rate_limit_key, backend.provider, backend.model_name(request), response)
+                        msg = response.choices[0].message.content.strip()
+                        st.session_state.messages.append({"role": "assistant", "content": msg})
+                        # st.chat_message("assistant").write(msg)  # 기존의 개별 메시지 표시 제거
+                    except Exception as e:
+                        st.error(f"AI 응답 생성에 실패했습니다. {friendly_error(e)}")
+
             user_message_count = sum(1 for msg in st.session_state.messages if msg["role"] == "user")
     
-            with st.spinner("응답을 기다리는 중..."):
-                try:
-                    response = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=st.session_state.messages
-                    )
-                    msg = response.choices[0].message.content.strip()
-                    st.session_state.messages.append({"role": "assistant", "content": msg})
-                    # st.chat_message("assistant").write(msg)  # 기존의 개별 메시지 표시 제거
-                except Exception as e:
-                    st.error(f"AI 응답 생성에 실패했습니다: {e}")
-    
             if user_message_count % 5 == 0 and user_message_count != st.session_state.last_email_count:
-                success = send_email(st.session_state.messages, student_name, st.session_state.teacher_email)
-                if success and st.session_state.teacher_email:
+                # 지난 이메일 이후에 추가된 대화만 보관하고 전송
+                result_id = archive_transcript(st.session_state.messages, student_name, st.session_state.last_email_index)
+                st.session_state.last_result_id = result_id
+                status = send_email(st.session_state.messages, student_name, st.session_state.teacher_email, start_index=st.session_state.last_email_index, result_id=result_id)
+                if status == "sent":
                     st.sidebar.success("대화 내역이 성공적으로 이메일로 전송되었습니다.")
-                    st.session_state.last_email_count = user_message_count
-                elif not st.session_state.teacher_email:
-                    # teacher_email이 없을 경우 별도의 메시지 없이 건너뜀
-                    st.session_state.last_email_count = user_message_count
-                else:
-                    st.sidebar.error("대화 내역 이메일 전송에 실패했습니다.")
+                elif status == "queued":
+                    st.sidebar.info("📮 메일 서버에 연결할 수 없어 대화 내역을 보관해 두었습니다. 연결되면 교사에게 자동으로 전송됩니다.")
+                elif status == "rejected":
+                    st.sidebar.warning("⚠️ 메일 서버가 메일을 거부하여 대화 내역을 전송하지 못했습니다. 선생님께 이메일 주소를 확인해 달라고 말씀드리세요.")
+                # 보관한 대화는 나중에 전송되고, teacher_email이 없으면 별도의 메시지 없이 건너뜀
+                st.session_state.last_email_count = user_message_count
+                st.session_state.last_email_index = len(st.session_state.messages)
             
             # 대화 내역을 업데이트하여 누적 스크롤 반영
             st.rerun()  # 페이지를 새로 고침하여 대화 내역을 갱신
@@ -0,0 +1,170 @@
+import streamlit as st
+import pathlib
+import toml
+import hmac
+import datetime
+from utils.static_assets import style_tag
+from utils.usage import usage_recorder
+from utils.hedge import stats_snapshot
+from utils.circuit_breaker import breaker_status
+from utils.mailer import outbox_size, failed_outbox_size, OUTBOX_MAX_ATTEMPTS
+from utils.archive import result_archive
+
+# 페이지 설정 - 아이콘과 제목 설정
+st.set_page_config(
+    page_title="교사용 사용량 관리",
+    page_icon="📊",
+    layout="wide",
+)
+
+# Streamlit의 기본 메뉴와 푸터 숨기기
+st.markdown(style_tag("hide_menu.css"), unsafe_allow_html=True)
+
+# secrets.toml 파일 경로
+secrets_path = pathlib.Path(__file__).parent.parent / ".streamlit/secrets.toml"
+
+# secrets.toml 파일 읽기
+with open(secrets_path, "r") as f:
+    secrets = toml.load(f)
+
+st.header("📊 교사용: AI 사용량과 비용")
+
+# 관리자 비밀번호 확인 (secrets.toml의 [admin] password)
+admin_password = secrets.get("admin", {}).get("password")
+if not admin_password:
+    st.error("⚠️ secrets.toml에 관리자 비밀번호([admin] password)가 설정되어 있지 않습니다.")
+    st.stop()
+
+if not st.session_state.get("admin_authenticated"):
+    password = st.text_input("🔒 관리자 비밀번호", type="password")
+    if st.button("확인"):
+        # 문자열끼리 비교하면 한글(ASCII가 아닌 글자)이 있을 때 오류가 나므로 바이트로 비교
+        if hmac.compare_digest(password.encode("utf-8"), str(admin_password).encode("utf-8")):
+            st.session_state.admin_authenticated = True
+            st.rerun()
+        else:
+            st.error("⚠️ 비밀번호가 올바르지 않습니다.")
+    st.stop()
+
+# 조회 기간 선택
+days = st.selectbox("📅 조회 기간", options=[1, 7, 30, 90], index=1, format_func=lambda d: f"최근 {d}일")
+since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+
+totals = usage_recorder.query(
+    """
+    SELECT SUM(requests) AS requests,
+           SUM(prompt_tokens + completion_tokens) AS tokens,
+           SUM(images) AS images,
+           ROUND(SUM(cost), 4) AS cost_usd
+    FROM usage WHERE day >= ?
+    """,
+    (since,),
+)[0]
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("요청 수", f"{totals['requests'] or 0:,}")
+col2.metric("토큰", f"{totals['tokens'] or 0:,}")
+col3.metric("생성 이미지", f"{totals['images'] or 0:,}")
+col4.metric("예상 비용 (USD)", f"${totals['cost_usd'] or 0:,.4f}")
+
+st.subheader("🏫 활동별 비용")
+st.dataframe(usage_recorder.query(
+    """
+    SELECT activity_code AS 활동_코드,
+           COUNT(DISTINCT student_id) AS 학생_수,
+           SUM(requests) AS 요청_수,
+           SUM(prompt_tokens) AS 입력_토큰,
+           SUM(completion_tokens) AS 출력_토큰,
+           SUM(images) AS 이미지,
+           ROUND(SUM(cost), 4) AS 비용_USD
+    FROM usage WHERE day >= ?
+    GROUP BY activity_code ORDER BY SUM(cost) DESC
+    """,
+    (since,),
+), use_container_width=True)
+
+st.subheader("🤖 모델별 비용")
+st.dataframe(usage_recorder.query(
+    """
+    SELECT provider AS 제공자, model AS 모델,
+           SUM(requests) AS 요청_수,
+           SUM(prompt_tokens + completion_tokens) AS 토큰,
+           SUM(images) AS 이미지,
+           ROUND(SUM(cost), 4) AS 비용_USD
+    FROM usage WHERE day >= ?
+    GROUP BY provider, model ORDER BY SUM(cost) DESC
+    """,
+    (since,),
+), use_container_width=True)
+
+st.subheader("🔥 사용량이 가장 많은 세션")
+st.dataframe(usage_recorder.query(
+    """
+    SELECT day AS 날짜, activity_code AS 활동_코드, student_id AS 학생_ID,
+           SUM(requests) AS 요청_수,
+           SUM(prompt_tokens) AS 입력_토큰,
+           SUM(completion_tokens) AS 출력_토큰,
+           ROUND(SUM(cost), 4) AS 비용_USD
+    FROM usage WHERE day >= ?
+    GROUP BY day, activity_code, student_id, session_id
+    ORDER BY SUM(prompt_tokens + completion_tokens) DESC, SUM(cost) DESC
+    LIMIT 20
+    """,
+    (since,),
+), use_container_width=True)
+
+st.subheader("📈 일별 비용")
+daily = usage_recorder.query(
+    "SELECT day, ROUND(SUM(cost), 4) AS cost_usd FROM usage WHERE day >= ? GROUP BY day ORDER BY day",
+    (since,),
+)
+if daily:
+    st.bar_chart(daily, x="day", y="cost_usd")
+else:
+    st.info("아직 기록된 사용량이 없습니다.")
+
+st.subheader("⏱️ 응답 시간과 겹쳐 보낸 요청")
+st.caption("이 서버 프로세스가 시작된 뒤의 단계별 기록입니다.")
+hedge_stats = stats_snapshot()
+if hedge_stats:
+    st.dataframe(hedge_stats, use_container_width=True)
+else:
+    st.info("아직 기록된 모델 호출이 없습니다.")
+
+st.subheader("🚦 외부 서비스 상태")
+st.caption("closed: 정상, open: 연속 실패로 잠시 호출을 멈춤, half_open: 시험 요청을 보낼 수 있음")
+st.dataframe(breaker_status(), use_container_width=True)
+pending_emails = outbox_size()
+if pending_emails:
+    st.warning(f"📮 전송을 기다리는 메일이 {pending_emails}통 있습니다. 메일 서버에 연결되면 자동으로 전송됩니다.")
+failed_emails = failed_outbox_size()
+if failed_emails:
+    st.error(f"✉️ {OUTBOX_MAX_ATTEMPTS}번 보내도 실패하여 전송을 멈춘 메일이 {failed_emails}통 있습니다. 결과는 결과 보관함에서 볼 수 있습니다.")
+
+st.subheader("🗂️ 결과 보관함")
+archive_stats = result_archive.stats()
+st.caption(f"보관된 결과 {archive_stats['results']:,}개, {archive_stats['bytes'] / 1024 / 1024:,.1f}MB (학생 이름은 활동별 가명 ID로 보관됩니다)")
+archive_code = st.text_input("활동 코드", key="archive_activity_code")
+archive_student = st.text_input("학생 이름 (비워 두면 활동 전체)", key="archive_student_name")
+if archive_code:
+    archived = result_archive.find(archive_code.strip(), archive_student.strip() or None)
+    if not archived:
+        st.info("보관된 결과가 없습니다.")
+    for result in archived:
+        created = datetime.datetime.fromtimestamp(result["created_at"]).strftime("%Y-%m-%d %H:%M")
+        with st.expander(f"#{result['id']} · {created} · {result['page']} · 학생 {result['student_id']}"):
+            st.markdown("**프롬프트**")
+            st.text(result["prompt"])
+            if result["input_text"]:
+                st.markdown("**학생 입력**")
+                st.text(result["input_text"])
+            if result["output_text"]:
+                st.markdown("**AI 결과**")
+                st.text(result["output_text"])
+            for digest in result["images"]:
+                image_data = result_archive.image(digest)
+                if image_data:
+                    st.image(image_data)
+if st.button("🧹 보관함 지금 정리하기"):
+    result_archive.compact()
+    st.success("기간이 지난 결과를 정리했습니다.")
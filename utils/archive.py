@@ -0,0 +1,276 @@
+import io
+import os
+import hmac
+import json
+import time
+import zlib
+import pathlib
+import secrets
+import sqlite3
+import hashlib
+import threading
+
+# 학생 활동 결과 보관함
+# 학생 이름 대신 활동별 가명 ID(HMAC)를, 프롬프트는 활동마다 한 벌만, 이미지는 내용 해시로 한 번만
+# 줄이고 압축하여 SQLite에 보관합니다. 오래되었거나 전체 크기를 넘으면 오래된 결과부터 지웁니다.
+ARCHIVE_DB_PATH = os.environ.get("ARCHIVE_DB_PATH", str(pathlib.Path(__file__).parent.parent / "archive.db"))
+ARCHIVE_KEY_ENV = "ARCHIVE_HMAC_KEY"  # 가명 ID를 만드는 비밀 키 (없으면 보관함 안에 만들어 둠)
+MAX_AGE_DAYS = int(os.environ.get("ARCHIVE_MAX_AGE_DAYS", "180"))
+MAX_TOTAL_BYTES = int(os.environ.get("ARCHIVE_MAX_MB", "500")) * 1024 * 1024
+COMPACT_INTERVAL_SECONDS = 3600  # 결과를 저장할 때 이 시간이 지났으면 배경에서 정리
+EVICT_BATCH = 100  # 크기를 넘었을 때 한 번에 지우는 결과 수
+IMAGE_MAX_SIDE = 1024
+IMAGE_QUALITY = 70
+
+
+def _pack(text):
+    return zlib.compress((text or "").encode("utf-8"), 9)
+
+
+def _unpack(data):
+    return zlib.decompress(data).decode("utf-8") if data else ""
+
+
+def compress_image(data):
+    # 긴 변을 줄이고 JPEG로 다시 저장 (이미지가 아니면 원본을 압축)
+    try:
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(data))
+        img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        output = io.BytesIO()
+        img.convert("RGB").save(output, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+        return output.getvalue(), "jpeg"
+    except Exception:
+        return zlib.compress(data, 9), "zlib"
+
+
+class ResultArchive:
+    """활동 결과를 작게 줄여 보관하고, 교사가 활동 코드와 학생 이름으로 다시 찾을 수 있게 합니다."""
+
+    def __init__(self, path=ARCHIVE_DB_PATH):
+        self.path = path
+        self._initialized = False
+        self._key = None
+        self._last_compact = 0
+        self._compact_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 새 파일에서만 적용됨
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS prompts (
+                    id INTEGER PRIMARY KEY,
+                    activity_code TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    text BLOB NOT NULL,
+                    UNIQUE (activity_code, digest)
+                );
+                CREATE TABLE IF NOT EXISTS images (
+                    digest TEXT PRIMARY KEY,
+                    format TEXT NOT NULL,
+                    data BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    page TEXT NOT NULL,
+                    activity_code TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    prompt_id INTEGER,
+                    input_text BLOB NOT NULL,
+                    output_text BLOB NOT NULL,
+                    images TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_by_student ON results (activity_code, student_id, created_at);
+                CREATE INDEX IF NOT EXISTS results_by_age ON results (created_at);
+            """)
+            self._initialized = True
+        else:
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _secret(self, conn):
+        # 환경 변수의 키를 우선 사용하고, 없으면 처음 한 번 만들어 보관
+        if self._key is None:
+            key = os.environ.get(ARCHIVE_KEY_ENV)
+            if not key:
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO meta VALUES ('hmac_key', ?)", (secrets.token_hex(32),))
+                key = conn.execute("SELECT value FROM meta WHERE key = 'hmac_key'").fetchone()[0]
+            self._key = key.encode("utf-8")
+        return self._key
+
+    def pseudonym(self, activity_code, student_name, conn=None):
+        # 같은 활동의 같은 학생은 같은 ID, 다른 활동끼리는 연결할 수 없는 ID
+        own = conn is None
+        conn = conn or self._connect()
+        try:
+            message = f"{activity_code}\0{student_name.strip()}".encode("utf-8")
+            return hmac.new(self._secret(conn), message, hashlib.sha256).hexdigest()[:16]
+        finally:
+            if own:
+                conn.close()
+
+    def pseudonyms(self, keys):
+        """(활동 코드, 학생 이름) 목록의 가명 ID를 한 번에 만들어 {(활동 코드, 학생 이름): ID}로 반환합니다."""
+        conn = self._connect()
+        try:
+            return {(code, name): self.pseudonym(code, name, conn) for code, name in set(keys)}
+        finally:
+            conn.close()
+
+    def add(self, page, activity_code, student_name, prompt, input_text, output_text, images=()):
+        """결과를 보관하고 결과 번호를 반환합니다. images는 원본 이미지 바이트 목록입니다."""
+        conn = self._connect()
+        try:
+            student_id = self.pseudonym(activity_code, student_name, conn)
+            image_digests = [hashlib.sha256(data).hexdigest() for data in images]
+            with conn:
+                prompt_id = None
+                if prompt:
+                    prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+                    conn.execute(
+                        "INSERT OR IGNORE INTO prompts (activity_code, digest, text) VALUES (?, ?, ?)",
+                        (activity_code, prompt_digest, _pack(prompt)),
+                    )
+                    prompt_id = conn.execute(
+                        "SELECT id FROM prompts WHERE activity_code = ? AND digest = ?",
+                        (activity_code, prompt_digest),
+                    ).fetchone()[0]
+                for digest, data in zip(image_digests, images):
+                    # 같은 이미지는 한 번만 줄여서 저장
+                    if conn.execute("SELECT 1 FROM images WHERE digest = ?", (digest,)).fetchone() is None:
+                        compressed, image_format = compress_image(data)
+                        conn.execute("INSERT OR IGNORE INTO images VALUES (?, ?, ?)", (digest, image_format, compressed))
+                cursor = conn.execute(
+                    "INSERT INTO results (created_at, page, activity_code, student_id, prompt_id, input_text, output_text, images)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), page, activity_code, student_id, prompt_id,
+                     _pack(input_text), _pack(output_text), json.dumps(image_digests)),
+                )
+            result_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self._maybe_compact()
+        return result_id
+
+    def find(self, activity_code, student_name=None, limit=50):
+        # 관리자 화면용: 활동(과 학생)의 최근 결과
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            sql = """
+                SELECT r.*, p.text AS prompt FROM results r LEFT JOIN prompts p ON p.id = r.prompt_id
+                WHERE r.activity_code = ?
+            """
+            params = [activity_code]
+            if student_name:
+                sql += " AND r.student_id = ?"
+                params.append(self.pseudonym(activity_code, student_name, conn))
+            sql += " ORDER BY r.created_at DESC LIMIT ?"
+            params.append(limit)
+            return [
+                {
+                    "id": row["id"],
+                    "created_at": row["created_at"],
+                    "page": row["page"],
+                    "student_id": row["student_id"],
+                    "prompt": _unpack(row["prompt"]),
+                    "input_text": _unpack(row["input_text"]),
+                    "output_text": _unpack(row["output_text"]),
+                    "images": json.loads(row["images"]),
+                }
+                for row in conn.execute(sql, params)
+            ]
+        finally:
+            conn.close()
+
+    def image(self, digest):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT format, data FROM images WHERE digest = ?", (digest,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return row[1] if row[0] == "jpeg" else zlib.decompress(row[1])
+
+    def _total_bytes(self, conn):
+        return conn.execute("""
+            SELECT (SELECT COALESCE(SUM(LENGTH(input_text) + LENGTH(output_text)), 0) FROM results)
+                 + (SELECT COALESCE(SUM(LENGTH(text)), 0) FROM prompts)
+                 + (SELECT COALESCE(SUM(LENGTH(data)), 0) FROM images)
+        """).fetchone()[0]
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return {"results": count, "bytes": self._total_bytes(conn)}
+        finally:
+            conn.close()
+
+    def _delete_orphans(self, conn):
+        # 어떤 결과도 가리키지 않는 프롬프트와 이미지 삭제
+        conn.execute("DELETE FROM prompts WHERE id NOT IN (SELECT prompt_id FROM results WHERE prompt_id IS NOT NULL)")
+        conn.execute("""
+            DELETE FROM images WHERE digest NOT IN (
+                SELECT DISTINCT value FROM results, json_each(results.images)
+            )
+        """)
+
+    def compact(self, now=None):
+        """기간이 지난 결과를 지우고, 전체 크기를 넘으면 오래된 결과부터 지운 뒤 빈 공간을 돌려줍니다."""
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM results WHERE created_at < ?", (now - MAX_AGE_DAYS * 86400,))
+                self._delete_orphans(conn)
+            while self._total_bytes(conn) > MAX_TOTAL_BYTES:
+                with conn:
+                    deleted = conn.execute(
+                        "DELETE FROM results WHERE id IN (SELECT id FROM results ORDER BY created_at LIMIT ?)",
+                        (EVICT_BATCH,),
+                    ).rowcount
+                    self._delete_orphans(conn)
+                if not deleted:
+                    break
+            conn.execute("PRAGMA incremental_vacuum")
+        finally:
+            conn.close()
+        self._last_compact = now
+
+    def _maybe_compact(self):
+        if time.time() - self._last_compact < COMPACT_INTERVAL_SECONDS:
+            return
+        if not self._compact_lock.acquire(blocking=False):
+            return  # 이미 정리 중
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self._compact_lock.release()
+
+        self._last_compact = time.time()
+        threading.Thread(target=run, name="archive-compact", daemon=True).start()
+
+
+# 프로세스 전체에서 공유하는 보관함
+result_archive = ResultArchive()
+
+
+def archive_result(page, activity_code, student_name, prompt, input_text, output_text, images=()):
+    """페이지에서 호출: 결과를 보관하고 결과 번호를 반환합니다. 보관에 실패해도 활동은 계속되도록 None을 반환합니다."""
+    try:
+        return result_archive.add(page, activity_code, student_name, prompt, input_text, output_text, images)
+    except (sqlite3.Error, OSError):
+        return None
@@ -0,0 +1,128 @@
+import time
+import openai
+from utils.shared_state import get_store
+from utils.hedge import DeadlineExceeded, OPENAI_RETRYABLE_ERRORS, HTTP_RETRYABLE_ERRORS
+
+# 외부 서비스(노션, OpenAI, Gemini, 메일)별 차단기
+# 연속으로 실패하면 차단기가 열려 일정 시간 동안 호출하지 않고 바로 실패합니다.
+# 시간이 지나면 요청 하나만 시험 삼아 보내고, 성공하면 다시 닫힙니다.
+# 상태는 공유 저장소에 두어 모든 워커 프로세스가 함께 사용합니다.
+DEFAULT_FAILURE_THRESHOLD = 3  # 이만큼 연속으로 실패하면 차단기를 엶
+DEFAULT_RESET_SECONDS = 30  # 차단기를 연 뒤 시험 요청을 보내기까지의 시간
+# OpenAI 차단기가 세는 장애 (할당량 초과는 API 키마다 다르므로 세지 않음)
+OPENAI_OUTAGE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """차단기가 열려 있어 외부 서비스를 호출하지 않았을 때 발생합니다."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, label, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS):
+        self.name = name
+        self.label = label  # 화면에 보여 줄 이름
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.key = f"breaker:{name}"
+
+    def state(self, now=None):
+        now = now or time.time()
+        data = get_store().get(self.key) or {}
+        if data.get("failures", 0) < self.failure_threshold:
+            return "closed"
+        return "half_open" if now >= data.get("retry_at", 0) else "open"
+
+    def _allow(self):
+        # 닫혀 있으면 쓰기 없이 통과, 열려 있으면 시험 요청 하나만 통과
+        if get_store().get(self.key, {}).get("failures", 0) < self.failure_threshold:
+            return
+        now = time.time()
+        allowed = False
+
+        def claim_trial(data):
+            nonlocal allowed
+            data = dict(data)
+            if data.get("failures", 0) < self.failure_threshold or now >= data.get("retry_at", 0):
+                allowed = True
+                data["retry_at"] = now + self.reset_seconds  # 시험 요청이 끝날 때까지 다른 요청은 막음
+            return data
+
+        data = get_store().update(self.key, claim_trial, default={})
+        if not allowed:
+            wait_seconds = max(1, int(data.get("retry_at", now) - now))
+            raise CircuitOpenError(
+                f"🔌 {self.label} 서비스에 연결할 수 없어 잠시 요청을 멈췄습니다. {wait_seconds}초 뒤에 다시 시도해 주세요."
+            )
+
+    def record_success(self):
+        if get_store().get(self.key, {}).get("failures", 0):
+            get_store().set(self.key, {})
+
+    def record_failure(self, error):
+        now = time.time()
+
+        def add_failure(data):
+            data = dict(data)
+            data["failures"] = data.get("failures", 0) + 1
+            data["last_error"] = type(error).__name__
+            if data["failures"] >= self.failure_threshold:
+                data.setdefault("opened_at", now)
+                data["retry_at"] = now + self.reset_seconds
+            return data
+
+        get_store().update(self.key, add_failure, default={})
+
+    def call(self, fn, failures=(Exception,)):
+        """fn()을 호출합니다. failures에 해당하는 오류만 실패로 셉니다 (잘못된 요청 등은 세지 않음)."""
+        self._allow()
+        try:
+            result = fn()
+        except failures as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+
+# 프로세스 전체에서 공유하는 외부 서비스별 차단기
+breakers = {
+    "notion": CircuitBreaker("notion", "노션"),
+    "openai": CircuitBreaker("openai", "OpenAI"),
+    "gemini": CircuitBreaker("gemini", "Gemini"),
+    "smtp": CircuitBreaker("smtp", "메일", reset_seconds=60),
+}
+
+
+def breaker_status():
+    # 관리자 화면용 차단기 상태
+    now = time.time()
+    rows = []
+    for breaker in breakers.values():
+        data = get_store().get(breaker.key) or {}
+        state = breaker.state(now)
+        rows.append({
+            "service": breaker.label,
+            "state": state,
+            "failures": data.get("failures", 0),
+            "retry_in_seconds": max(0, round(data["retry_at"] - now)) if state == "open" else None,
+            "last_error": data.get("last_error"),
+        })
+    return rows
+
+
+def friendly_error(error):
+    """오류를 학생에게 보여 줄 짧은 안내 문구로 바꿉니다."""
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return str(error)
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return "🚦 지금 AI 사용량이 많아요. 1분쯤 뒤에 다시 시도해 주세요."
+    if isinstance(status, int) and status >= 500:
+        return "🛠️ AI 서비스에 일시적인 문제가 있어요. 잠시 후 다시 시도해 주세요."
+    if isinstance(error, (TimeoutError,) + OPENAI_RETRYABLE_ERRORS + HTTP_RETRYABLE_ERRORS):
+        return "🌐 연결이 불안정하거나 서비스가 응답하지 않아요. 잠시 후 다시 시도해 주세요."
+    return "⚠️ 요청을 처리하지 못했어요. 입력한 내용을 확인하고 다시 시도해 주세요."
@@ -0,0 +1,210 @@
+import time
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import openai
+import requests
+from utils.replay import REPLAY_MODE
+
+# 모델 호출에 시간 제한(deadline)을 두고, 늦어지면 같은 요청을 한 번 더 보내 먼저 온 응답을 사용하는 기능
+# 노션 'settings' 속성의 "deadlines" 항목으로 활동마다 단계별 설정을 바꿀 수 있습니다.
+DEFAULT_STAGE_CONFIG = {
+    "text.generate": {"budget_seconds": 30, "hedge": True},
+    "chatbot.reply": {"budget_seconds": 30, "hedge": True},
+    "image.generate": {"budget_seconds": 90, "hedge": False},  # 이미지는 두 번 생성하면 비용이 두 배라 기본으로 끔
+    "image.download": {"budget_seconds": 20, "hedge": True},
+    "vision.analyze": {"budget_seconds": 40, "hedge": True},
+    "vision.stream": {"budget_seconds": 40, "hedge": True},  # 스트리밍 분석 (겹쳐 보내기는 첫 조각까지)
+}
+# 다른 요청(다른 API 키)으로 넘어가 다시 시도할 오류
+OPENAI_RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+HTTP_RETRYABLE_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+
+LATENCY_WINDOW = 100  # p95 계산에 쓰는 최근 응답 수
+MIN_SAMPLES = 5  # 이보다 기록이 적으면 시간 제한의 절반이 지난 뒤 겹쳐 보냄
+DEFAULT_HEDGE_FRACTION = 0.5
+
+
+class DeadlineExceeded(TimeoutError):
+    """단계별 시간 제한 안에 응답을 받지 못했을 때 발생합니다."""
+
+
+def merge_deadline_config(settings, stage):
+    # 노션 설정과 기본 설정을 합치기
+    config = dict(DEFAULT_STAGE_CONFIG.get(stage, {"budget_seconds": 30, "hedge": False}))
+    overrides = (settings or {}).get("deadlines", {})
+    if isinstance(overrides.get(stage), dict):
+        config.update(overrides[stage])
+    return config
+
+
+class StageStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedges = 0  # 겹쳐 보낸 요청 수
+        self.hedge_wins = 0  # 겹쳐 보낸 요청이 먼저 도착한 수
+        self.cancelled = 0  # 결과를 버리거나 취소한 요청 수
+        self.billed_discards = 0  # 결과를 버렸지만 끝까지 실행되어 과금된 요청 수
+        self.deadline_exceeded = 0
+        self.errors = 0
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="provider")
+
+
+def _stage(stage):
+    with _stats_lock:
+        return _stats.setdefault(stage, StageStats())
+
+
+def reset_stats():
+    # 단계별 통계 비우기 (벤치마크 시나리오마다 같은 상태에서 시작하도록)
+    with _stats_lock:
+        _stats.clear()
+
+
+def stage_p95(stage):
+    with _stats_lock:
+        samples = sorted(_stats[stage].latencies) if stage in _stats else []
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def hedge_delay(stage, config):
+    # 설정값이 있으면 그대로, 없으면 최근 p95 (기록이 부족하면 시간 제한의 절반)
+    if config.get("hedge_after_seconds"):
+        return config["hedge_after_seconds"]
+    p95 = stage_p95(stage)
+    return p95 if p95 is not None else config["budget_seconds"] * DEFAULT_HEDGE_FRACTION
+
+
+def stats_snapshot():
+    # 관리자 화면용 단계별 통계
+    rows = []
+    for stage in sorted(_stats):
+        stats = _stage(stage)
+        p95 = stage_p95(stage)
+        rows.append({
+            "stage": stage,
+            "calls": stats.calls,
+            "p95_seconds": round(p95, 2) if p95 is not None else None,
+            "hedges": stats.hedges,
+            "hedge_wins": stats.hedge_wins,
+            "hedge_win_rate": round(stats.hedge_wins / stats.hedges, 2) if stats.hedges else None,
+            "cancelled": stats.cancelled,
+            "billed_discards": stats.billed_discards,
+            "deadline_exceeded": stats.deadline_exceeded,
+            "errors": stats.errors,
+        })
+    return rows
+
+
+def _finish_discarded(stats, name, on_discard, future):
+    # 결과를 버린 요청이 끝까지 실행되어 성공했으면 (제공자는 과금함) 과금 수를 세고 on_discard로 결과 전달
+    if future.cancelled() or future.exception() is not None:
+        return
+    with _stats_lock:
+        stats.billed_discards += 1
+    if on_discard:
+        on_discard(name, future.result())
+
+
+def run_hedged(stage, attempts, config, retryable=(), on_error=None, on_discard=None):
+    """attempts의 첫 요청을 보내고, 늦어지면 두 번째 요청을 겹쳐 보내 먼저 성공한 결과를 반환합니다.
+
+    attempts는 (이름, 호출 함수) 목록입니다. retryable 오류가 나면 다음 요청으로 넘어가며,
+    on_error(이름, 오류)는 실패하거나 시간 안에 끝나지 않은 요청마다 호출됩니다.
+    이미 실행 중인 요청은 취소할 수 없으므로, 결과를 버린 요청이 나중에 성공하면
+    작업 스레드에서 on_discard(이름, 결과)를 호출합니다 (사용량 기록용, st.* 호출 금지).
+    반환값은 (결과, 사용한 요청 이름)입니다.
+    """
+    stats = _stage(stage)
+    candidates = list(attempts)
+    started = time.perf_counter()
+    deadline = time.time() + config["budget_seconds"]
+    delay = hedge_delay(stage, config)
+    # 기록/재생 모드에서는 겹쳐 보내지 않음 (겹친 요청이 이전 시나리오의 p95에 따라 생기면 결과가 달라짐)
+    hedge_enabled = config.get("hedge", False) and not REPLAY_MODE
+    pending = {}  # future -> (순서, 이름)
+    launched = 0
+    hedged = False
+    last_error = None
+
+    def launch():
+        nonlocal launched
+        name, fn = candidates.pop(0)
+        pending[_executor.submit(fn)] = (launched, name)
+        launched += 1
+
+    with _stats_lock:
+        stats.calls += 1
+    launch()
+
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        can_hedge = hedge_enabled and not hedged and candidates
+        elapsed = time.perf_counter() - started
+        wait_for = min(remaining, max(0, delay - elapsed)) if can_hedge else remaining
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        if not done:
+            if can_hedge:
+                hedged = True
+                with _stats_lock:
+                    stats.hedges += 1
+                launch()
+            continue
+
+        for future in done:
+            order, name = pending.pop(future)
+            try:
+                result = future.result()
+            except retryable as e:
+                last_error = e
+                with _stats_lock:
+                    stats.errors += 1
+                if on_error:
+                    on_error(name, e)
+                if candidates and not pending:
+                    launch()
+                continue
+            except Exception:
+                with _stats_lock:
+                    stats.errors += 1
+                raise
+
+            # 먼저 끝난 결과를 사용하고 나머지 요청은 취소하거나 결과를 버림
+            for other, (_, other_name) in pending.items():
+                if not other.cancel():
+                    other.add_done_callback(partial(_finish_discarded, stats, other_name, on_discard))
+            with _stats_lock:
+                stats.latencies.append(time.perf_counter() - started)
+                stats.cancelled += len(pending)
+                if hedged and order > 0:
+                    stats.hedge_wins += 1
+            return result, name
+
+    with _stats_lock:
+        stats.cancelled += len(pending)
+        if pending or last_error is None:
+            stats.deadline_exceeded += 1
+    for future, (_, name) in pending.items():
+        if not future.cancel():
+            future.add_done_callback(partial(_finish_discarded, stats, name, on_discard))
+        if on_error:
+            on_error(name, DeadlineExceeded())
+    if pending or last_error is None:
+        raise DeadlineExceeded("⏰ AI 응답이 너무 오래 걸려 중단했습니다. 잠시 후 다시 시도해 주세요.")
+    raise last_error
@@ -0,0 +1,168 @@
+import os
+import queue
+import pathlib
+import threading
+from concurrent.futures import Future
+from functools import partial
+from utils.hedge import run_hedged, OPENAI_RETRYABLE_ERRORS
+from utils.circuit_breaker import breakers, CircuitOpenError, OPENAI_OUTAGE_ERRORS
+
+# 텍스트 생성·챗봇 페이지의 대화 모델 선택
+# 노션 'settings' 속성의 "backend" 항목으로 활동마다 고릅니다.
+#   "openai" : OpenAI만 사용 (기본값)
+#   "local"  : 이 서버의 CPU에서 실행하는 로컬 모델만 사용 (인터넷·할당량과 무관)
+#   "auto"   : OpenAI를 먼저 쓰고, 실패하면 로컬 모델로 대체
+# 로컬 모델은 llama-cpp-python과 GGUF 모델 파일(LOCAL_MODEL_PATH 환경 변수)이 있어야 합니다.
+LOCAL_MODEL_PATH_ENV = "LOCAL_MODEL_PATH"
+DEFAULT_LOCAL_CONFIG = {
+    "max_tokens": 512,
+    "temperature": 0.7,
+}
+LOCAL_CONTEXT_TOKENS = 4096  # 로컬 모델의 문맥 길이 (n_ctx)
+MESSAGE_OVERHEAD_TOKENS = 8  # 메시지마다 대화 형식(역할 표시 등)에 쓰이는 대략의 토큰 수
+
+
+class LocalModelUnavailable(RuntimeError):
+    """로컬 모델을 불러올 수 없을 때 발생합니다 (다른 대화 모델로 넘어갈 수 있음)."""
+
+
+class LocalChatEngine:
+    """프로세스 전체에서 한 번만 불러 두는 llama.cpp 모델과 요청 대기열
+
+    모델 하나는 동시에 하나의 요청만 처리할 수 있으므로, 작업 스레드 하나가 대기열의 요청을
+    들어온 순서대로 처리합니다. 처리 전에 취소된 요청(겹쳐 보낸 요청 중 진 쪽, 시간 초과)은 건너뜁니다.
+    긴 대화는 문맥 길이에 맞도록 오래된 메시지부터 빼고 보냅니다.
+    """
+
+    def __init__(self, model_path):
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise LocalModelUnavailable("llama-cpp-python이 설치되어 있지 않습니다.") from e
+        self.model_name = "local:" + pathlib.Path(model_path).stem
+        self._llama = Llama(model_path=model_path, n_ctx=LOCAL_CONTEXT_TOKENS, n_threads=os.cpu_count(), verbose=False)
+        self._queue = queue.Queue()
+        threading.Thread(target=self._worker, name="local-llm", daemon=True).start()
+
+    def submit(self, messages, max_tokens, temperature):
+        future = Future()
+        self._queue.put((future, {"messages": messages, "max_tokens": max_tokens, "temperature": temperature}))
+        return future
+
+    def _fit_context(self, messages, max_tokens):
+        # 교사 프롬프트(시스템 메시지)는 남기고, 답변 길이까지 문맥에 들어가도록 오래된 대화부터 뺌
+        def cost(message):
+            return len(self._llama.tokenize(message["content"].encode("utf-8"), add_bos=False)) + MESSAGE_OVERHEAD_TOKENS
+
+        system = [message for message in messages if message["role"] == "system"]
+        used = sum(cost(message) for message in system)
+        kept = []
+        for message in reversed([message for message in messages if message["role"] != "system"]):
+            used += cost(message)
+            if used > LOCAL_CONTEXT_TOKENS - max_tokens and kept:
+                break
+            kept.append(message)
+        while len(kept) > 1 and kept[-1]["role"] == "assistant":
+            kept.pop()  # 남은 대화가 학생 메시지로 시작하도록
+        return system + kept[::-1]
+
+    def _worker(self):
+        from openai.types.chat import ChatCompletion
+
+        while True:
+            future, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue  # 이미 취소된 요청
+            try:
+                kwargs = dict(kwargs, messages=self._fit_context(kwargs["messages"], kwargs["max_tokens"]))
+                completion = self._llama.create_chat_completion(**kwargs)
+            except ValueError as e:
+                # 메시지 하나가 문맥 길이보다 긴 경우 등: 다른 대화 모델로 넘어갈 수 있게 함
+                future.set_exception(LocalModelUnavailable(f"로컬 모델이 처리할 수 없는 길이입니다: {e}"))
+                continue
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            try:
+                # llama.cpp의 응답은 OpenAI 형식이므로 같은 객체로 바꾸어 페이지 코드를 그대로 사용
+                future.set_result(ChatCompletion.model_validate(completion))
+            except Exception as e:
+                future.set_exception(e)
+
+
+_local_engine = None
+_local_engine_lock = threading.Lock()
+
+
+def get_local_engine():
+    # 처음 요청할 때 한 번만 모델을 불러와 계속 재사용
+    global _local_engine
+    with _local_engine_lock:
+        if _local_engine is None:
+            model_path = os.environ.get(LOCAL_MODEL_PATH_ENV)
+            if not model_path or not os.path.exists(model_path):
+                raise LocalModelUnavailable("로컬 모델 파일이 설정되어 있지 않습니다.")
+            _local_engine = LocalChatEngine(model_path)
+        return _local_engine
+
+
+class OpenAIChatBackend:
+    provider = "openai"
+
+    def __init__(self, client, name="openai"):
+        self.client = client
+        self.name = name
+
+    def model_name(self, request):
+        return request["model"]
+
+    def complete(self, request):
+        # OpenAI 차단기가 열려 있으면 기다리지 않고 바로 다음 대화 모델로 넘어감
+        return breakers["openai"].call(lambda: self.client.chat.completions.create(**request), OPENAI_OUTAGE_ERRORS)
+
+
+class LocalChatBackend:
+    provider = "local"
+    name = "local"
+
+    def __init__(self, settings):
+        self.config = dict(DEFAULT_LOCAL_CONFIG)
+        if isinstance(settings.get("local_model"), dict):
+            self.config.update(settings["local_model"])
+
+    def model_name(self, request):
+        return get_local_engine().model_name
+
+    def complete(self, request):
+        future = get_local_engine().submit(request["messages"], self.config["max_tokens"], self.config["temperature"])
+        try:
+            return future.result(timeout=request.get("timeout"))
+        finally:
+            future.cancel()  # 시간 초과로 끝났다면 아직 시작하지 않은 요청은 처리하지 않음
+
+
+def chat_backends(settings, client, hedge_client):
+    """활동 설정에 따라 시도할 대화 모델 목록을 순서대로 반환합니다."""
+    settings = settings or {}
+    choice = settings.get("backend", "openai")
+    backends = []
+    if choice in ("openai", "auto"):
+        backends.append(OpenAIChatBackend(client))
+        backends.append(OpenAIChatBackend(hedge_client, name="openai-hedge"))
+    if choice in ("local", "auto"):
+        backends.append(LocalChatBackend(settings))
+    return backends
+
+
+def complete_chat(stage, backends, request, deadline_config, on_discard=None):
+    """대화 모델들을 시간 제한 안에서 차례로(늦어지면 겹쳐서) 시도하여 (응답, 사용한 모델)을 반환합니다.
+
+    on_discard(응답, 모델)는 결과를 버린 겹친 요청이 나중에 끝났을 때 작업 스레드에서 호출됩니다.
+    """
+    by_name = {backend.name: backend for backend in backends}
+    attempts = [(backend.name, partial(backend.complete, request)) for backend in backends]
+    response, name = run_hedged(
+        stage, attempts, deadline_config, OPENAI_RETRYABLE_ERRORS + (LocalModelUnavailable, CircuitOpenError),
+        on_discard=(lambda discarded_name, discarded: on_discard(discarded, by_name[discarded_name])) if on_discard else None,
+    )
+    return response, by_name[name]
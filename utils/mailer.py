@@ -0,0 +1,117 @@
+import time
+import smtplib
+import threading
+from utils.shared_state import get_store
+from utils.circuit_breaker import breakers, CircuitOpenError
+
+# 교사에게 보내는 메일 전송
+# 메일 서버에 연결할 수 없으면 공유 저장소의 대기열에 보관하고, 배경 스레드가 나중에 다시 보냅니다.
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 465
+SMTP_TIMEOUT_SECONDS = 15
+OUTBOX_QUEUE = "email_outbox"
+OUTBOX_INTERVAL_SECONDS = 30  # 대기열을 확인하는 간격
+OUTBOX_BATCH = 10
+OUTBOX_MAX_ATTEMPTS = 10  # 이만큼 보내다 실패한 메일은 대기열에서 빼서 따로 보관
+OUTBOX_FAILED_QUEUE = "email_outbox_failed"
+
+# 메일 계정은 공유 저장소에 넣지 않고 이 프로세스 메모리에만 보관
+_credentials = None
+_outbox_thread = None
+_outbox_lock = threading.Lock()
+
+SMTP_FAILURES = (smtplib.SMTPException, OSError)  # 연결·인증·전송 실패 (OSError에 시간 초과 포함)
+
+
+def _deliver(items, on_done=None):
+    # 연결 한 번으로 여러 메일을 보내고 메일마다 "sent" 또는 "rejected"(메일 서버가 영구 거부)를 반환.
+    # 한 통을 처리할 때마다 on_done(번호)을 호출하여, 도중에 연결이 끊겨도 이미 보낸 메일은 다시 보내지 않게 함
+    address, password = _credentials
+    statuses = []
+    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as server:
+        server.login(address, password)
+        for item_id, item in items:
+            try:
+                recipients = [address.strip() for address in item["to"].split(",") if address.strip()]  # 여러 교사 주소
+                server.sendmail(item["from"], recipients, item["message"].encode("utf-8"))
+                statuses.append("sent")
+            except smtplib.SMTPRecipientsRefused:
+                statuses.append("rejected")  # 잘못된 주소는 다시 보내도 실패함 (장애로 세지 않음)
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code < 500:
+                    e.failed_item = item_id  # 일시적인 실패: 어느 메일을 보내다 실패했는지 표시
+                    raise
+                statuses.append("rejected")  # 5xx 응답은 이 메일만의 영구 실패이므로 다음 메일을 계속 보냄
+            except SMTP_FAILURES as e:
+                e.failed_item = item_id
+                raise
+            if on_done:
+                on_done(item_id)
+    return statuses
+
+
+def _retry_later(store, item_id, item):
+    # 보내다 실패한 메일은 시도 횟수를 늘려 대기열 맨 뒤로 보내고 (뒤의 메일이 막히지 않게),
+    # 너무 많이 실패하면 따로 보관
+    attempts = item.get("attempts", 0) + 1
+    store.ack(OUTBOX_QUEUE, [item_id])
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        store.push(OUTBOX_FAILED_QUEUE, dict(item, attempts=attempts))
+    else:
+        store.push(OUTBOX_QUEUE, dict(item, attempts=attempts))
+
+
+def _drain_outbox():
+    while True:
+        time.sleep(OUTBOX_INTERVAL_SECONDS)
+        store = get_store()
+        if not store.queue_size(OUTBOX_QUEUE):
+            continue
+        # 임대 시간 동안 다른 워커가 같은 메일을 가져가지 않음
+        claimed = store.claim(OUTBOX_QUEUE, limit=OUTBOX_BATCH, lease_seconds=OUTBOX_INTERVAL_SECONDS * 4)
+        if not claimed:
+            continue
+        try:
+            # 보낸 메일과 거부된 메일은 바로 대기열에서 지움 (남은 메일만 임대 시간이 지나면 다시 시도)
+            breakers["smtp"].call(
+                lambda: _deliver(claimed, on_done=lambda item_id: store.ack(OUTBOX_QUEUE, [item_id])),
+                SMTP_FAILURES,
+            )
+        except CircuitOpenError:
+            continue
+        except SMTP_FAILURES as e:
+            # 연결·로그인 실패는 메일 탓이 아니므로 세지 않음
+            failed_item = getattr(e, "failed_item", None)
+            if failed_item is not None:
+                _retry_later(store, failed_item, dict(claimed)[failed_item])
+
+
+def _start_outbox():
+    global _outbox_thread
+    with _outbox_lock:
+        if _outbox_thread is None:
+            _outbox_thread = threading.Thread(target=_drain_outbox, name="email-outbox", daemon=True)
+            _outbox_thread.start()
+
+
+def send_or_queue(msg, address, password):
+    """메일을 보내고 "sent"를 반환합니다. 메일 서버가 메일을 영구 거부하면 "rejected"를,
+    메일 서버에 연결할 수 없으면 대기열에 넣고 "queued"를 반환합니다."""
+    global _credentials
+    _credentials = (address, password)
+    _start_outbox()
+    item = {"from": msg["From"], "to": msg["To"], "message": msg.as_string()}
+    try:
+        return breakers["smtp"].call(lambda: _deliver([(None, item)]), SMTP_FAILURES)[0]
+    except (CircuitOpenError,) + SMTP_FAILURES:
+        get_store().push(OUTBOX_QUEUE, item)
+        return "queued"
+
+
+def outbox_size():
+    return get_store().queue_size(OUTBOX_QUEUE)
+
+
+def failed_outbox_size():
+    # 여러 번 보내다 실패하여 따로 보관한 메일 수
+    return get_store().queue_size(OUTBOX_FAILED_QUEUE)
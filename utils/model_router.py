@@ -0,0 +1,174 @@
+import time
+import threading
+from collections import deque
+from functools import partial
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from utils.replay import wrap_gemini_model
+from utils.hedge import run_hedged, DeadlineExceeded
+from utils.circuit_breaker import breakers, CircuitOpenError
+
+# 이미지 분석 페이지의 Gemini 모델 선택기
+# 노션 'settings' 속성의 "gemini" 항목으로 활동마다 모델 순서를 바꿀 수 있습니다.
+# 시간 제한과 겹쳐 보내기는 "deadlines"의 "vision.analyze" 항목(스트리밍은 "vision.stream" 항목)을 따릅니다.
+DEFAULT_ROUTER_CONFIG = {
+    "models": ["gemini-1.5-flash", "gemini-1.5-flash-8b"],  # 우선순위 순서의 대체 모델 목록
+}
+LATENCY_WINDOW = 50  # p95 계산에 쓰는 최근 응답 수
+MIN_SAMPLES = 5  # 이보다 기록이 적으면 설정된 순서를 따름
+COOLDOWN_SECONDS = 60  # 할당량 초과나 시간 초과 후 그 모델을 쉬게 하는 시간
+
+# 다른 모델로 바꾸어 다시 시도할 오류
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    TimeoutError,
+)
+# Gemini 차단기가 세는 장애 (할당량 초과는 모델마다 다르므로 세지 않음)
+OUTAGE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+)
+
+
+def merge_router_config(settings):
+    # 노션 설정과 기본 설정을 합치기
+    config = dict(DEFAULT_ROUTER_CONFIG)
+    if settings and isinstance(settings.get("gemini"), dict):
+        config.update(settings["gemini"])
+    return config
+
+
+class ModelRouter:
+    """최근 p95 지연 시간이 가장 짧은 모델로 요청을 보내고, 실패하면 다음 모델로 넘깁니다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}  # 모델 이름 -> GenerativeModel (한 번만 생성)
+        self._latencies = {}  # 모델 이름 -> 최근 지연 시간
+        self._cooldown_until = {}  # 모델 이름 -> 다시 사용할 수 있는 시각
+
+    def reset_stats(self):
+        # 지연 시간 기록과 쉬는 모델 비우기 (벤치마크 시나리오마다 같은 상태에서 시작하도록)
+        with self._lock:
+            self._latencies.clear()
+            self._cooldown_until.clear()
+
+    def get_model(self, name):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = wrap_gemini_model(genai.GenerativeModel(name))
+            return self._models[name]
+
+    def p95(self, name):
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _record_latency(self, name, seconds):
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def _cool_down(self, name, error=None):
+        with self._lock:
+            self._cooldown_until[name] = time.time() + COOLDOWN_SECONDS
+
+    def ranked_models(self, models):
+        # 쉬고 있지 않은 모델을 p95 순으로 (기록이 부족하면 설정 순서대로), 쉬는 모델은 맨 뒤에
+        now = time.time()
+        with self._lock:
+            cooling = {name for name in models if self._cooldown_until.get(name, 0) > now}
+
+        def sort_key(item):
+            index, name = item
+            p95 = self.p95(name)
+            return (name in cooling, p95 is None, p95 or 0, index)
+
+        return [name for _, name in sorted(enumerate(models), key=sort_key)]
+
+    def _call(self, name, contents):
+        started = time.perf_counter()
+
+        def generate():
+            response = self.get_model(name).generate_content(contents)
+            response.resolve()
+            return response
+
+        response = breakers["gemini"].call(generate, OUTAGE_ERRORS)
+        self._record_latency(name, time.perf_counter() - started)
+        return response
+
+    def _open_stream(self, name, contents, deadline):
+        # 스트리밍 요청은 첫 조각이 도착하면 반환됨 (겹쳐 보내기는 첫 조각까지만 경쟁)
+        # 요청 전체(남은 조각 포함)의 제한 시간은 요청 옵션으로 넘겨, 도중에 멈춘 스트림도 시간 안에 끝나게 함
+        started = time.perf_counter()
+        timeout = max(1.0, deadline - time.time())
+        response = breakers["gemini"].call(
+            lambda: self.get_model(name).generate_content(contents, stream=True, request_options={"timeout": timeout}),
+            OUTAGE_ERRORS,
+        )
+        return response, started
+
+    def _stream_text(self, name, response, started, deadline):
+        # 조각의 텍스트를 차례로 내보내고, 끝까지 받으면 전체 응답 시간을 기록 (중간에 끊기면 차단기에 실패로 셈)
+        try:
+            for chunk in response:
+                if time.time() > deadline:
+                    raise DeadlineExceeded("⏰ AI 응답이 너무 오래 걸려 중단했습니다. 잠시 후 다시 시도해 주세요.")
+                if chunk.parts:
+                    yield chunk.text
+        except OUTAGE_ERRORS as e:
+            breakers["gemini"].record_failure(e)
+            raise
+        self._record_latency(name, time.perf_counter() - started)
+
+    @staticmethod
+    def _drain_discarded(on_discard, name, opened):
+        # 겹쳐 보냈다가 진 스트림은 끝까지 읽어 연결을 닫고 (요청 제한 시간 안에 끝남), 과금된 사용량을 넘김
+        response, _ = opened
+        try:
+            for _ in response:
+                pass
+        except Exception:
+            return
+        if on_discard:
+            on_discard(response, name)
+
+    def generate(self, contents, config, deadline_config, on_discard=None):
+        """(응답, 사용한 모델 이름)을 반환합니다. 모든 모델이 실패하면 오류를 다시 발생시킵니다.
+
+        on_discard(응답, 모델 이름)는 결과를 버린 겹친 요청이 나중에 끝났을 때 작업 스레드에서 호출됩니다.
+        """
+        attempts = [(name, partial(self._call, name, contents)) for name in self.ranked_models(list(config["models"]))]
+        return run_hedged(
+            "vision.analyze", attempts, deadline_config, RETRYABLE_ERRORS + (CircuitOpenError,), on_error=self._cool_down,
+            on_discard=(lambda name, response: on_discard(response, name)) if on_discard else None,
+        )
+
+    def stream(self, contents, config, deadline_config, on_discard=None):
+        """(텍스트 조각 생성기, 응답, 사용한 모델 이름)을 반환합니다.
+
+        budget_seconds는 마지막 조각까지의 제한 시간이고, 겹쳐 보내기는 첫 조각이 도착할 때까지만 적용합니다.
+        생성기를 끝까지 읽은 뒤에는 응답의 text와 usage_metadata에 전체 결과가 들어 있습니다.
+        on_discard(응답, 모델 이름)는 겹쳐 보냈다가 진 스트림을 다 읽은 뒤 작업 스레드에서 호출됩니다.
+        """
+        deadline = time.time() + deadline_config["budget_seconds"]
+        attempts = [
+            (name, partial(self._open_stream, name, contents, deadline))
+            for name in self.ranked_models(list(config["models"]))
+        ]
+        (response, started), name = run_hedged(
+            "vision.stream", attempts, deadline_config, RETRYABLE_ERRORS + (CircuitOpenError,), on_error=self._cool_down,
+            on_discard=partial(self._drain_discarded, on_discard),
+        )
+        return self._stream_text(name, response, started, deadline), response, name
+
+
+# 프로세스 전체에서 공유하는 선택기 (모델 객체와 지연 시간 기록을 재사용)
+model_router = ModelRouter()
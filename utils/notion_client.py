@@ -0,0 +1,40 @@
+import requests
+from utils.replay import recorded_post
+from utils.hedge import HTTP_RETRYABLE_ERRORS
+from utils.circuit_breaker import breakers
+from utils.notion_records import parse_page
+
+# 노션 API 호출 (노션 차단기와 기록/재생 계층을 거침)
+NOTION_QUERY_URL = "https://api.notion.com/v1/databases/{database_id}/query"
+NOTION_VERSION = "2022-06-28"
+NOTION_TIMEOUT_SECONDS = 10
+NOTION_FAILURES = HTTP_RETRYABLE_ERRORS + (requests.exceptions.HTTPError,)
+
+
+def notion_post(url, headers=None, json=None):
+    """노션 API 호출 (노션 차단기를 거침). 429와 5xx 응답은 장애로 보고 예외를 발생시킵니다."""
+    def post():
+        response = recorded_post(url, headers=headers, json=json, timeout=NOTION_TIMEOUT_SECONDS)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    return breakers["notion"].call(post, NOTION_FAILURES)
+
+
+def query_activity(api_key, database_id, activity_code, schema):
+    """노션 데이터베이스에서 활동 코드가 같은 첫 번째 올바른 기록을 찾습니다. 없으면 None을 반환합니다."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Notion-Version": NOTION_VERSION,
+    }
+    payload = {"filter": {"property": "activity_code", "rich_text": {"equals": activity_code}}}
+    response = notion_post(NOTION_QUERY_URL.format(database_id=database_id), headers=headers, json=payload)
+    if response.status_code != 200:
+        return None
+    for page in response.json().get("results") or []:
+        record = parse_page(page, schema)
+        if record is not None:
+            return record
+    return None
@@ -0,0 +1,203 @@
+import re
+import json
+from types import MappingProxyType
+
+# 노션 데이터베이스의 활동 페이지를 한 번에 읽어 고정된 기록(ActivityRecord)으로 바꾸는 파서
+# 페이지마다 필요한 속성과 기본값은 ActivitySchema로 정하고, 네 페이지가 같은 파서를 사용합니다.
+# 노션 API 호출은 utils/notion_client.py에 있으며, 이 모듈은 다른 패키지 없이 가져올 수 있습니다.
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+# 기록 필드 -> (노션 속성 이름, 종류)
+FIELDS = {
+    "prompt": ("prompt", "text"),
+    "student_view": ("student_view", "text"),
+    "teacher_email": ("email", "email"),
+    "adjectives": ("adjectives", "json_list"),
+    "settings": ("settings", "json_object"),
+}
+
+# settings 안의 항목별 값 종류 (종류가 맞지 않는 값은 빼고 각 기능의 기본값을 사용)
+SETTINGS_TYPES = {
+    "prefilter": {
+        "min_length": "number",
+        "max_length": "number",
+        "blocked_keywords": "text_list",
+        "blocked_patterns": "text_list",
+        "repeat_window_seconds": "number",
+        "max_repeats": "number",
+        "canned_response": "text",
+    },
+    "rate_limit": {
+        "requests_per_minute": "number",
+        "burst": "number",
+        "token_budget": "optional_number",
+        "activity_token_budget": "optional_number",
+    },
+    "gemini": {"models": "text_list"},
+    "local_model": {"max_tokens": "number", "temperature": "number"},
+}
+# "deadlines"는 단계 이름마다 같은 종류의 설정을 가짐
+STAGE_SETTINGS_TYPES = {"budget_seconds": "number", "hedge": "bool", "hedge_after_seconds": "number"}
+KIND_NAMES = {
+    "number": "숫자",
+    "optional_number": "숫자 또는 null",
+    "bool": "true 또는 false",
+    "text": "문자열",
+    "text_list": "문자열 목록",
+}
+
+
+class ActivityRecord:
+    """노션 활동 페이지 하나의 값 (만든 뒤에는 바꿀 수 없음)
+
+    problems에는 선택 속성(settings 안의 값 포함)을 읽지 못해 기본값을 쓴 이유가 들어 있습니다.
+    settings는 읽기 전용 매핑(안의 목록은 튜플)이므로, 세션 상태나 캐시에 넣을 때는 thaw()로 바꿔 쓰세요.
+    """
+
+    __slots__ = ("activity_code", "prompt", "student_view", "teacher_email", "adjectives", "settings", "problems")
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ActivityRecord는 바꿀 수 없습니다.")
+
+    def __delattr__(self, name):
+        raise AttributeError("ActivityRecord는 바꿀 수 없습니다.")
+
+    def __repr__(self):
+        return f"ActivityRecord(activity_code={self.activity_code!r}, prompt={self.prompt[:20]!r}...)"
+
+
+class ActivitySchema:
+    """페이지마다 반드시 있어야 하는 속성과 비어 있을 때의 기본값"""
+
+    def __init__(self, required=("prompt",), defaults=None):
+        self.required = tuple(required)
+        self.defaults = {"prompt": "", "student_view": "", "teacher_email": "", "adjectives": (), "settings": {}}
+        self.defaults.update(defaults or {})
+        self.defaults = {field: _freeze(value) for field, value in self.defaults.items()}
+
+
+def _freeze(value):
+    # JSON 값을 바꿀 수 없는 값으로 (dict -> MappingProxyType, list -> tuple)
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """_freeze로 만든 값을 JSON으로 저장할 수 있는 일반 dict와 list로 되돌립니다."""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def rich_text(properties, name):
+    # 여러 조각으로 나뉜 rich_text를 모두 이어 붙이기 (긴 프롬프트가 잘리지 않게)
+    prop = properties.get(name)
+    segments = prop.get("rich_text") if prop else None
+    if not segments:
+        return ""
+    if len(segments) == 1:
+        segment = segments[0]
+        return (segment.get("plain_text") or (segment.get("text") or {}).get("content", "")).strip()
+    return "".join(
+        segment.get("plain_text") or (segment.get("text") or {}).get("content", "")
+        for segment in segments
+    ).strip()
+
+
+def _matches(kind, value):
+    if kind == "optional_number":
+        return value is None or _matches("number", value)
+    if kind == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == "bool":
+        return isinstance(value, bool)
+    if kind == "text":
+        return isinstance(value, str)
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _check_section(name, section, types, problems):
+    # 종류가 맞지 않는 값을 뺀 항목 (모르는 값은 그대로 둠)
+    if not isinstance(section, dict):
+        problems.append(f"settings.{name}: JSON 객체 형식이 아닙니다.")
+        return None
+    checked = {}
+    for key, value in section.items():
+        kind = types.get(key)
+        if kind and not _matches(kind, value):
+            problems.append(f"settings.{name}.{key}: {KIND_NAMES[kind]} 형식이 아닙니다.")
+            continue
+        checked[key] = value
+    return checked
+
+
+def check_settings(settings, problems):
+    """알려진 settings 항목의 값 종류를 검사하여, 맞지 않는 값을 뺀 settings를 반환합니다.
+
+    뺀 값마다 problems에 이유를 추가합니다. 뺀 값은 각 기능의 merge_*_config에서 기본값으로 채워집니다.
+    """
+    checked = {}
+    for name, section in settings.items():
+        if name in SETTINGS_TYPES:
+            section = _check_section(name, section, SETTINGS_TYPES[name], problems)
+        elif name == "deadlines" and isinstance(section, dict):
+            section = {
+                stage: _check_section(f"deadlines.{stage}", stage_config, STAGE_SETTINGS_TYPES, problems)
+                for stage, stage_config in section.items()
+            }
+            section = {stage: stage_config for stage, stage_config in section.items() if stage_config is not None}
+        elif name == "deadlines":
+            problems.append("settings.deadlines: JSON 객체 형식이 아닙니다.")
+            section = None
+        if section is not None:
+            checked[name] = section
+    return checked
+
+
+def parse_page(page, schema):
+    """노션 페이지 하나를 ActivityRecord로 바꿉니다. 필수 속성이 비어 있으면 None을 반환합니다."""
+    properties = page.get("properties") or {}
+    values = {"activity_code": rich_text(properties, "activity_code")}
+    problems = []
+    for field, (property_name, kind) in FIELDS.items():
+        raw = rich_text(properties, property_name)
+        value = schema.defaults[field]
+        if not raw:
+            pass
+        elif kind == "text":
+            value = raw
+        elif kind == "email":
+            # 쉼표로 여러 주소를 적을 수 있음 (형식이 맞는 주소만 사용)
+            addresses = [address.strip() for address in raw.split(",") if address.strip()]
+            valid = [address for address in addresses if EMAIL_PATTERN.fullmatch(address)]
+            if valid:
+                value = ", ".join(valid)
+            if len(valid) < len(addresses):
+                invalid = ", ".join(address for address in addresses if address not in valid)
+                problems.append(f"{property_name}: 이메일 형식이 아닌 주소({invalid})는 사용하지 않습니다.")
+        else:
+            try:
+                parsed = json.loads(raw)
+            except json.JSONDecodeError:
+                parsed = None
+            if kind == "json_list" and isinstance(parsed, list) and all(isinstance(item, str) for item in parsed):
+                value = tuple(parsed)
+            elif kind == "json_object" and isinstance(parsed, dict):
+                value = _freeze(check_settings(parsed, problems))
+            else:
+                expected = "문자열 목록" if kind == "json_list" else "JSON 객체"
+                problems.append(f"{property_name}: {expected} 형식이 아닙니다.")
+        if field in schema.required and not value:
+            return None
+        values[field] = value
+    values["problems"] = tuple(problems)
+    return ActivityRecord(**values)
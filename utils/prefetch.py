@@ -0,0 +1,92 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from functools import partial
+import streamlit as st
+from utils.shared_state import cached_call, get_store
+
+# 활동 코드 입력이 끝나면(Enter 또는 입력창을 벗어날 때) 노션 조회를 미리 시작하는 기능
+# 결과는 페이지(namespace)별로 세션 상태에 보관하고, '프롬프트 가져오기' 버튼은 보관된 결과를 한 번 사용합니다.
+# 입력창 바로 아래의 버튼을 누르면 on_change와 버튼 클릭이 같은 실행에서 처리되므로,
+# 미리 조회가 도움이 되는 것은 코드를 입력한 뒤 다른 곳을 먼저 누른 경우뿐입니다.
+PREFETCH_STATE_PREFIX = "notion_prefetch"
+PREFETCH_TTL_SECONDS = 60  # cached_call의 기본 만료 시간과 같게
+MIN_CODE_LENGTH = 3
+
+# 프로세스 전체에서 공유하는 조회용 스레드 (노션 조회 함수는 st.* 를 호출하지 않아야 함)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="notion-prefetch")
+
+
+def is_plausible_code(code):
+    # 공백 없이 일정 길이 이상인 코드만 미리 조회
+    code = (code or "").strip()
+    return len(code) >= MIN_CODE_LENGTH and re.fullmatch(r"\S+", code) is not None
+
+
+def _fetch_and_remember(namespace, fetch_fn, code):
+    # 조회에 성공한 활동은 만료 없이 따로 보관 (노션 장애 때 사용)
+    result = fetch_fn(code)
+    if result and result[0]:
+        get_store().set(f"last_good:{namespace}:{code}", list(result))
+    return result
+
+
+def _lookup(namespace, code, fetch_fn):
+    """캐시를 거쳐 조회합니다. 노션이 응답하지 않으면 (결과, True)로 마지막으로 성공한 기록을 반환합니다."""
+    try:
+        return cached_call(namespace, code, partial(_fetch_and_remember, namespace, fetch_fn)), False
+    except Exception:
+        last_good = get_store().get(f"last_good:{namespace}:{code}")
+        if last_good is None:
+            raise
+        return tuple(last_good), True
+
+
+def _state_key(namespace):
+    # 세션 상태는 모든 페이지가 공유하므로 페이지마다 따로 보관 (페이지마다 결과 형식이 다름)
+    return f"{PREFETCH_STATE_PREFIX}:{namespace}"
+
+
+def start_prefetch(session_state, namespace, code, fetch_fn):
+    """text_input의 on_change에서 호출합니다. 이전 코드의 조회는 취소합니다."""
+    key = _state_key(namespace)
+    current = session_state.get(key)
+    if current and current["code"] == code and time.time() - current["started_at"] < PREFETCH_TTL_SECONDS:
+        return
+    if current:
+        # 아직 시작하지 않은 조회는 취소하고, 진행 중인 조회는 결과를 버림
+        current["future"].cancel()
+        del session_state[key]
+    if is_plausible_code(code):
+        session_state[key] = {
+            "namespace": namespace,
+            "code": code,
+            "started_at": time.time(),
+            "future": _executor.submit(_lookup, namespace, code, fetch_fn),
+        }
+
+
+def resolve_activity(session_state, namespace, code, fetch_fn, timeout=30):
+    """미리 조회한 결과가 있으면 한 번 사용하고, 없거나 오래되었거나 실패했으면 지금 조회합니다.
+
+    노션에 연결할 수 없고 보관된 기록도 없으면 예외를 발생시킵니다.
+    """
+    result = None
+    current = session_state.pop(_state_key(namespace), None)  # 다음 버튼 클릭 때는 새로 조회
+    if (
+        current
+        and current["namespace"] == namespace
+        and current["code"] == code
+        and time.time() - current["started_at"] < PREFETCH_TTL_SECONDS
+    ):
+        try:
+            result, stale = current["future"].result(timeout=timeout)
+        except (CancelledError, Exception):
+            result = None  # 실패한 조회는 버리고 다시 시도
+    elif current:
+        current["future"].cancel()
+    if result is None:
+        result, stale = _lookup(namespace, code, fetch_fn)
+    if stale:
+        st.info("📦 노션에 연결할 수 없어 마지막으로 불러온 활동 정보를 사용합니다.")
+    return result
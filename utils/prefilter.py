@@ -0,0 +1,87 @@
+import re
+import json
+import time
+import hashlib
+from functools import lru_cache
+
+# 모델을 호출하기 전에 학생 입력을 로컬에서 먼저 걸러내는 사전 필터
+# 노션 'settings' 속성의 "prefilter" 항목으로 활동마다 설정을 바꿀 수 있습니다.
+DEFAULT_PREFILTER_CONFIG = {
+    "min_length": 1,  # 이보다 짧은 입력은 차단
+    "max_length": 1000,  # 이보다 긴 입력은 차단
+    "blocked_keywords": [],  # 포함되면 차단할 단어 목록
+    "blocked_patterns": [
+        r"(.)\1{9,}",  # 같은 글자를 10번 이상 반복 (예: ㅋㅋㅋㅋㅋㅋㅋㅋㅋㅋ)
+        r"^[\W_]+$",  # 기호나 공백만 있는 입력
+    ],
+    "repeat_window_seconds": 60,  # 반복 입력을 확인할 시간 범위(초)
+    "max_repeats": 2,  # 시간 범위 안에서 같은 입력을 허용할 횟수
+    "canned_response": "🙂 주어진 활동과 관련된 내용을 다시 입력해 주세요.",
+}
+
+# 차단 사유별 안내 문구 (canned_response 대신 사용할 수 있는 기본값)
+BLOCK_MESSAGES = {
+    "empty": "✏️ 내용을 입력해 주세요.",
+    "too_short": "✏️ 조금 더 자세히 입력해 주세요.",
+    "too_long": "✂️ 입력이 너무 깁니다. 조금 줄여서 다시 입력해 주세요.",
+    "repeated": "🔁 같은 내용을 여러 번 입력했어요. 다른 내용을 입력해 주세요.",
+}
+
+
+def merge_prefilter_config(settings):
+    # 노션 설정과 기본 설정을 합치기
+    config = dict(DEFAULT_PREFILTER_CONFIG)
+    if settings and isinstance(settings.get("prefilter"), dict):
+        config.update(settings["prefilter"])
+    return config
+
+
+@lru_cache(maxsize=128)
+def _compile_rules(config_key):
+    # 같은 설정에 대해서는 정규식을 한 번만 컴파일
+    config = json.loads(config_key)
+    keywords = tuple(keyword.lower() for keyword in config.get("blocked_keywords", []) if keyword)
+    patterns = []
+    for pattern in config.get("blocked_patterns", []):
+        try:
+            patterns.append(re.compile(pattern, re.IGNORECASE))
+        except re.error:
+            continue  # 잘못된 정규식은 무시
+    return keywords, tuple(patterns)
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def check_student_input(text, config, history, now=None):
+    """학생 입력을 검사하여 (통과 여부, 차단 시 보여줄 응답)을 반환합니다.
+
+    history는 세션마다 유지되는 (시각, 해시) 목록이며 이 함수가 갱신합니다.
+    """
+    now = time.time() if now is None else now
+    normalized = _normalize(text or "")
+
+    if not normalized:
+        return False, BLOCK_MESSAGES["empty"]
+    if len(normalized) < config.get("min_length", 0):
+        return False, BLOCK_MESSAGES["too_short"]
+    if config.get("max_length") and len(normalized) > config["max_length"]:
+        return False, BLOCK_MESSAGES["too_long"]
+
+    keywords, patterns = _compile_rules(json.dumps(config, sort_keys=True, ensure_ascii=False))
+    if any(keyword in normalized for keyword in keywords):
+        return False, config["canned_response"]
+    if any(pattern.search(normalized) for pattern in patterns):
+        return False, config["canned_response"]
+
+    # 반복 입력 감지: 시간 범위 안의 같은 입력 횟수 세기
+    window = config.get("repeat_window_seconds", 0)
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    history[:] = [(ts, h) for ts, h in history if now - ts <= window]
+    repeats = sum(1 for _, h in history if h == digest)
+    history.append((now, digest))
+    if repeats >= config.get("max_repeats", 0) > 0:
+        return False, BLOCK_MESSAGES["repeated"]
+
+    return True, None
@@ -0,0 +1,101 @@
+import json
+import time
+from utils.shared_state import get_store
+
+# 학생별·활동별 요청 수 제한과 토큰 예산
+# 노션 'settings' 속성의 "rate_limit" 항목으로 활동마다 설정을 바꿀 수 있습니다.
+DEFAULT_RATE_LIMIT_CONFIG = {
+    "requests_per_minute": 10,  # 학생 한 명(세션)이 1분에 보낼 수 있는 요청 수
+    "burst": 5,  # 한꺼번에 보낼 수 있는 최대 요청 수
+    "token_budget": None,  # 학생 한 명(세션)이 쓸 수 있는 총 토큰 수 (None이면 제한 없음)
+    "activity_token_budget": None,  # 활동 전체가 쓸 수 있는 총 토큰 수 (None이면 제한 없음)
+}
+
+# 사용량 기록을 보관하는 시간 (하루)
+USAGE_TTL_SECONDS = 24 * 60 * 60
+
+
+def merge_rate_limit_config(settings):
+    # 노션 설정과 기본 설정을 합치기
+    config = dict(DEFAULT_RATE_LIMIT_CONFIG)
+    if settings and isinstance(settings.get("rate_limit"), dict):
+        config.update(settings["rate_limit"])
+    return config
+
+
+def current_session_id():
+    # 현재 Streamlit 세션 ID (스크립트 밖에서 호출하면 빈 문자열)
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else ""
+    except ImportError:
+        return ""
+
+
+class RateLimiter:
+    """(활동 코드, 학생 이름, 세션) 단위의 토큰 버킷과 토큰 사용량을 관리합니다.
+
+    상태는 공유 저장소에 있으므로 여러 워커 프로세스가 같은 제한을 적용합니다.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    @staticmethod
+    def _key(kind, key):
+        return f"ratelimit:{kind}:" + json.dumps(list(key), ensure_ascii=False)
+
+    def remaining_budget(self, key, config):
+        # 학생과 활동 예산 중 더 적게 남은 쪽 (제한이 없으면 None)
+        remaining = []
+        if config.get("token_budget"):
+            remaining.append(config["token_budget"] - self.store.get(self._key("tokens", key), 0))
+        if config.get("activity_token_budget"):
+            remaining.append(config["activity_token_budget"] - self.store.get(self._key("activity", key[:1]), 0))
+        return max(0, min(remaining)) if remaining else None
+
+    def acquire(self, key, config, now=None, cost=1):
+        """요청 cost개를 한꺼번에 허용할지 결정하여 (허용 여부, 안내 문구)를 반환합니다.
+
+        모두 허용할 수 없으면 하나도 꺼내지 않습니다.
+        """
+        now = time.time() if now is None else now
+        remaining = self.remaining_budget(key, config)
+        if remaining is not None and remaining <= 0:
+            return False, "🎫 이 활동에서 사용할 수 있는 AI 사용량을 모두 사용했습니다. 선생님께 문의하세요."
+
+        capacity = max(1, config["burst"])
+        if cost > capacity:
+            return False, f"⏳ 한 번에 보낼 수 있는 요청은 {capacity}개까지입니다. 나누어서 요청하세요."
+        rate = config["requests_per_minute"] / 60.0
+        result = {}
+
+        def take(bucket):
+            # 지난 요청 이후 시간만큼 채운 뒤 cost개 꺼내기
+            tokens, updated = bucket or (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            result["allowed"] = tokens >= cost
+            result["tokens"] = tokens
+            return [tokens - cost if tokens >= cost else tokens, now]
+
+        self.store.update(self._key("bucket", key), take, ttl=USAGE_TTL_SECONDS)
+        if not result["allowed"]:
+            wait_seconds = int((cost - result["tokens"]) / rate) + 1 if rate > 0 else 60
+            return False, f"⏳ 요청이 너무 많습니다. {wait_seconds}초 후에 다시 시도하세요."
+        return True, None
+
+    def record_tokens(self, key, total_tokens):
+        # 응답의 토큰 사용량을 학생과 활동 예산에 반영
+        if not total_tokens:
+            return
+        self.store.update(self._key("tokens", key), lambda used: (used or 0) + total_tokens, ttl=USAGE_TTL_SECONDS)
+        self.store.update(self._key("activity", key[:1]), lambda used: (used or 0) + total_tokens, ttl=USAGE_TTL_SECONDS)
+
+
+# 프로세스 전체에서 공유하는 제한기
+rate_limiter = RateLimiter()
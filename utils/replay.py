@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import pathlib
+import threading
+import requests
+
+# 노션·OpenAI·Gemini 호출을 기록하고 다시 재생하는 계층 (성능 비교용)
+# PROVIDER_REPLAY_MODE=record  : 실제로 호출하고 응답과 걸린 시간을 fixture 파일로 저장
+# PROVIDER_REPLAY_MODE=replay  : 네트워크 없이 fixture 파일의 응답을 기록된 시간만큼 기다렸다가 반환
+# 설정하지 않으면 아무것도 감싸지 않습니다.
+REPLAY_MODE = os.environ.get("PROVIDER_REPLAY_MODE", "")
+FIXTURES_DIR = pathlib.Path(os.environ.get(
+    "PROVIDER_FIXTURES_DIR",
+    pathlib.Path(__file__).parent.parent / "benchmarks" / "fixtures",
+))
+# 재생 시 기록된 지연 시간에 곱할 배율 (0이면 기다리지 않음)
+REPLAY_SPEED = float(os.environ.get("PROVIDER_REPLAY_SPEED", "1.0"))
+
+# 기록·재생한 호출 목록 (벤치마크 실행기가 읽음)
+call_log = []
+_call_log_lock = threading.Lock()
+
+
+class FixtureMissing(Exception):
+    """재생 모드에서 요청에 맞는 fixture 파일이 없을 때 발생합니다."""
+
+
+def _request_key(kind, payload):
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return f"{kind}-{digest.hexdigest()[:16]}"
+
+
+def _log_call(kind, latency, response_bytes, tokens):
+    with _call_log_lock:
+        call_log.append({"kind": kind, "latency": latency, "bytes": response_bytes, "tokens": tokens})
+
+
+def _record_or_replay(kind, payload, call, serialize, deserialize, count_tokens, wait=True):
+    """모드에 따라 실제 호출을 기록하거나 저장된 응답을 재생합니다.
+
+    wait=False이면 재생할 때 기록된 시간만큼 미리 기다리지 않습니다 (스트리밍처럼 deserialize가 나누어 기다릴 때).
+    """
+    path = FIXTURES_DIR / f"{_request_key(kind, payload)}.json"
+
+    if REPLAY_MODE == "replay":
+        if not path.exists():
+            raise FixtureMissing(f"{kind} 요청에 대한 fixture가 없습니다: {path.name}")
+        fixture = json.loads(path.read_text(encoding="utf-8"))
+        if wait and REPLAY_SPEED:
+            time.sleep(fixture["latency"] * REPLAY_SPEED)
+        response = deserialize(fixture["response"])
+        _log_call(kind, fixture["latency"], len(json.dumps(fixture["response"])), count_tokens(response))
+        return response
+
+    started = time.perf_counter()
+    response = call()
+    latency = time.perf_counter() - started
+    serialized = serialize(response)
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"kind": kind, "latency": latency, "response": serialized}, ensure_ascii=False), encoding="utf-8")
+    _log_call(kind, latency, len(json.dumps(serialized)), count_tokens(response))
+    return response
+
+
+class ReplayedHTTPResponse:
+    """requests.Response 중 페이지가 사용하는 부분만 흉내 낸 재생용 응답"""
+
+    def __init__(self, data):
+        self.status_code = data["status_code"]
+        self.content = base64.b64decode(data["content"])
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replayed)")
+
+
+def _serialize_http(response):
+    return {"status_code": response.status_code, "content": base64.b64encode(response.content).decode("ascii")}
+
+
+def _no_tokens(response):
+    return 0
+
+
+def recorded_post(url, headers=None, json=None, **kwargs):
+    # 노션 조회용 requests.post (헤더의 API 키는 fixture 키에 넣지 않음)
+    call = lambda: requests.post(url, headers=headers, json=json, **kwargs)
+    if not REPLAY_MODE:
+        return call()
+    return _record_or_replay("notion", {"url": url, "json": json}, call, _serialize_http, ReplayedHTTPResponse, _no_tokens)
+
+
+def recorded_get(url, **kwargs):
+    # 생성된 이미지 내려받기용 requests.get (재생 시 만료된 URL 대신 저장된 내용 사용)
+    call = lambda: requests.get(url, **kwargs)
+    if not REPLAY_MODE:
+        return call()
+    return _record_or_replay("http_get", {"url": url.split("?")[0]}, call, _serialize_http, ReplayedHTTPResponse, _no_tokens)
+
+
+def _openai_tokens(response):
+    usage = getattr(response, "usage", None)
+    return usage.total_tokens if usage else 0
+
+
+def wrap_openai_client(client):
+    """client.chat.completions.create와 client.images.generate를 기록·재생 계층으로 감쌉니다."""
+    if not REPLAY_MODE:
+        return client
+    from openai.types.chat import ChatCompletion
+    from openai.types import ImagesResponse
+
+    create = client.chat.completions.create
+    generate = client.images.generate
+
+    def recorded_create(**kwargs):
+        return _record_or_replay(
+            "openai_chat", kwargs, lambda: create(**kwargs),
+            lambda r: r.model_dump(mode="json"), ChatCompletion.model_validate, _openai_tokens,
+        )
+
+    def recorded_generate(**kwargs):
+        return _record_or_replay(
+            "openai_image", kwargs, lambda: generate(**kwargs),
+            lambda r: r.model_dump(mode="json"), ImagesResponse.model_validate, _no_tokens,
+        )
+
+    client.chat.completions.create = recorded_create
+    client.images.generate = recorded_generate
+    return client
+
+
+def _gemini_payload(model_name, contents):
+    # PIL 이미지는 픽셀 해시로 바꾸어 요청 키 만들기
+    parts = []
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if hasattr(part, "tobytes"):
+            parts.append({"image": hashlib.sha1(part.tobytes()).hexdigest(), "size": list(part.size)})
+        else:
+            parts.append(part)
+    return {"model": model_name, "contents": parts}
+
+
+def _gemini_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return usage.total_token_count if usage else 0
+
+
+def _replayed_chunks(chunks, protos):
+    # 기록된 조각을 기록된 간격만큼 기다렸다가 하나씩 내보내기 (첫 조각까지의 시간도 재현)
+    for chunk in chunks:
+        if REPLAY_MODE == "replay" and REPLAY_SPEED:
+            time.sleep(chunk["delay"] * REPLAY_SPEED)
+        yield protos.GenerateContentResponse(chunk["response"])
+
+
+def wrap_gemini_model(model):
+    """model.generate_content를 기록·재생 계층으로 감쌉니다. stream=True 요청은 조각과 조각 사이 시간을 함께 기록합니다."""
+    if not REPLAY_MODE:
+        return model
+    from google.generativeai import protos
+    from google.generativeai.types import GenerateContentResponse
+
+    generate_content = model.generate_content
+
+    def recorded_stream(contents, **kwargs):
+        def call():
+            chunks = []
+            last = time.perf_counter()
+            for chunk in generate_content(contents, **kwargs):
+                now = time.perf_counter()
+                chunks.append({"delay": now - last, "response": chunk.to_dict()})
+                last = now
+            return chunks
+
+        chunks = _record_or_replay(
+            "gemini", dict(_gemini_payload(model.model_name, contents), stream=True), call,
+            lambda chunks: chunks,
+            lambda chunks: chunks,
+            lambda chunks: (chunks[-1]["response"].get("usage_metadata") or {}).get("total_token_count", 0) if chunks else 0,
+            wait=False,
+        )
+        return GenerateContentResponse.from_iterator(_replayed_chunks(chunks, protos))
+
+    def recorded_generate_content(contents, **kwargs):
+        if kwargs.get("stream"):
+            return recorded_stream(contents, **kwargs)
+
+        def call():
+            response = generate_content(contents, **kwargs)
+            response.resolve()
+            return response
+
+        return _record_or_replay(
+            "gemini", _gemini_payload(model.model_name, contents), call,
+            lambda r: r.to_dict(),
+            lambda d: GenerateContentResponse.from_response(protos.GenerateContentResponse(d)),
+            _gemini_tokens,
+        )
+
+    model.generate_content = recorded_generate_content
+    return model
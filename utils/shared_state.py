@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+
+# 여러 Streamlit 워커 프로세스가 함께 쓰는 공유 상태 저장소
+# SHARED_STATE_PATH 환경 변수가 있으면 SQLite(WAL 모드) 파일을, 없으면 프로세스 메모리를 사용합니다.
+SHARED_STATE_ENV = "SHARED_STATE_PATH"
+
+
+class MemoryStore:
+    """단일 프로세스용 저장소 (기본값)"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}  # key -> (value, 만료 시각)
+        self._queues = {}  # queue -> {id: [item, 임대 만료 시각]}
+        self._next_id = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires_at = self._values.get(key, (default, None))
+            if expires_at is not None and expires_at < time.time():
+                del self._values[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def update(self, key, fn, default=None, ttl=None):
+        # 읽기-수정-쓰기를 한 번에 처리하고 새 값을 반환
+        with self._lock:
+            value = fn(self.get(key, default))
+            self.set(key, value, ttl)
+            return value
+
+    def push(self, queue, item):
+        with self._lock:
+            self._next_id += 1
+            self._queues.setdefault(queue, {})[self._next_id] = [item, 0]
+            return self._next_id
+
+    def claim(self, queue, limit=10, lease_seconds=60):
+        # 아직 처리되지 않은 항목을 가져오고, 임대 시간 동안 다른 워커가 가져가지 않게 표시
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for item_id, entry in self._queues.get(queue, {}).items():
+                if len(claimed) >= limit:
+                    break
+                if entry[1] <= now:
+                    entry[1] = now + lease_seconds
+                    claimed.append((item_id, entry[0]))
+        return claimed
+
+    def ack(self, queue, item_ids):
+        # 처리가 끝난 항목 삭제
+        with self._lock:
+            items = self._queues.get(queue, {})
+            for item_id in item_ids:
+                items.pop(item_id, None)
+
+    def queue_size(self, queue):
+        with self._lock:
+            return len(self._queues.get(queue, {}))
+
+
+class SQLiteStore:
+    """여러 프로세스가 함께 쓰는 SQLite(WAL 모드) 저장소"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                item TEXT NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS queue_by_name ON queue (queue, leased_until);
+        """)
+
+    def _conn(self):
+        # 스레드마다 연결을 하나씩 사용 (트랜잭션은 직접 관리)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, conn, key, default):
+        row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def _write(self, conn, key, value, ttl):
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None),
+        )
+
+    def get(self, key, default=None):
+        return self._read(self._conn(), key, default)
+
+    def set(self, key, value, ttl=None):
+        conn = self._conn()
+        self._write(conn, key, value, ttl)
+        # 가끔씩 만료된 값 정리
+        if random.random() < 0.01:
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+
+    def update(self, key, fn, default=None, ttl=None):
+        # BEGIN IMMEDIATE로 다른 프로세스의 쓰기를 막은 상태에서 읽기-수정-쓰기
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = fn(self._read(conn, key, default))
+            self._write(conn, key, value, ttl)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def push(self, queue, item):
+        cursor = self._conn().execute(
+            "INSERT INTO queue (queue, item) VALUES (?, ?)",
+            (queue, json.dumps(item, ensure_ascii=False)),
+        )
+        return cursor.lastrowid
+
+    def claim(self, queue, limit=10, lease_seconds=60):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, item FROM queue WHERE queue = ? AND leased_until <= ? ORDER BY id LIMIT ?",
+                (queue, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE queue SET leased_until = ? WHERE id = ?",
+                [(now + lease_seconds, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def ack(self, queue, item_ids):
+        self._conn().executemany(
+            "DELETE FROM queue WHERE queue = ? AND id = ?",
+            [(queue, item_id) for item_id in item_ids],
+        )
+
+    def queue_size(self, queue):
+        return self._conn().execute("SELECT COUNT(*) FROM queue WHERE queue = ?", (queue,)).fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # 프로세스마다 저장소를 한 번만 생성
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get(SHARED_STATE_ENV)
+            _store = SQLiteStore(path) if path else MemoryStore()
+        return _store
+
+
+def cached_call(namespace, key, fn, ttl=60):
+    """공유 저장소에 결과를 캐시합니다. 비어 있는(첫 값이 없는) 결과는 캐시하지 않습니다."""
+    store = get_store()
+    cache_key = f"cache:{namespace}:{key}"
+    cached = store.get(cache_key)
+    if cached is not None:
+        return tuple(cached)
+    result = fn(key)
+    if result and result[0]:
+        store.set(cache_key, list(result), ttl)
+    return result
@@ -0,0 +1,27 @@
+import re
+import pathlib
+from functools import lru_cache
+
+# static/ 폴더의 CSS와 HTML을 프로세스마다 한 번만 읽고 줄여서(minify) 재사용
+STATIC_DIR = pathlib.Path(__file__).parent.parent / "static"
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)  # 주석 제거
+    css = re.sub(r"\s+", " ", css)  # 공백 합치기
+    css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)  # 기호 주변 공백 제거
+    return css.replace(";}", "}").strip()
+
+
+@lru_cache(maxsize=None)
+def style_tag(*names):
+    # 여러 CSS 파일을 하나의 <style> 태그로 합치기
+    css = "".join(minify_css((STATIC_DIR / name).read_text(encoding="utf-8")) for name in names)
+    return f"<style>{css}</style>"
+
+
+@lru_cache(maxsize=None)
+def static_html(name):
+    # 태그 사이 공백과 들여쓰기를 없애 한 줄로 (들여쓴 줄이 markdown 코드 블록으로 보이지 않게)
+    html = (STATIC_DIR / name).read_text(encoding="utf-8")
+    return re.sub(r">\s+<", "><", html).strip()
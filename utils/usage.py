@@ -0,0 +1,159 @@
+import os
+import time
+import atexit
+import sqlite3
+import pathlib
+import datetime
+import threading
+from utils.archive import result_archive, MAX_AGE_DAYS
+
+# 활동·학생·모델별 토큰 사용량과 비용 기록
+# 호출마다 메모리에서 합산하고, 일정 개수나 시간이 지나면 SQLite 표에 한꺼번에 반영합니다.
+# 학생 이름은 저장하지 않고 결과 보관함과 같은 활동별 가명 ID로 바꾸며, 보관 기간도 결과 보관함을 따릅니다.
+USAGE_DB_PATH = os.environ.get("USAGE_DB_PATH", str(pathlib.Path(__file__).parent.parent / "usage.db"))
+FLUSH_EVERY_RECORDS = 20  # 이만큼 기록이 쌓이면 저장
+FLUSH_INTERVAL_SECONDS = 30  # 마지막 저장 후 이 시간이 지나면 저장
+PRUNE_INTERVAL_SECONDS = 3600  # 저장할 때 이 시간이 지났으면 보관 기간이 지난 기록 삭제
+USAGE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS usage (
+        day TEXT NOT NULL,
+        activity_code TEXT NOT NULL,
+        student_id TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        requests INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        images INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        PRIMARY KEY (day, activity_code, student_id, session_id, provider, model)
+    )
+"""
+
+# 모델별 가격 (USD, 토큰은 100만 개당, 이미지는 1장당)
+MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30},
+    "gemini-1.5-flash-8b": {"input": 0.0375, "output": 0.15},
+    "gemini-1.5-pro": {"input": 1.25, "output": 5.00},
+    "dall-e-3": {"image": 0.04},
+}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, images=0):
+    prices = MODEL_PRICES.get(model, {})
+    return (
+        prompt_tokens * prices.get("input", 0) / 1_000_000
+        + completion_tokens * prices.get("output", 0) / 1_000_000
+        + images * prices.get("image", 0)
+    )
+
+
+def response_tokens(provider, response):
+    # 응답 객체에서 (입력 토큰, 출력 토큰) 꺼내기
+    if provider in ("openai", "local"):  # 로컬 모델도 OpenAI 형식의 응답을 반환 (비용은 0)
+        usage = getattr(response, "usage", None)
+        return (usage.prompt_tokens, usage.completion_tokens) if usage else (0, 0)
+    if provider == "gemini":
+        usage = getattr(response, "usage_metadata", None)
+        return (usage.prompt_token_count, usage.candidates_token_count) if usage else (0, 0)
+    return 0, 0
+
+
+class UsageRecorder:
+    """사용량을 메모리에서 합산하고 주기적으로 SQLite에 저장합니다."""
+
+    def __init__(self, path=USAGE_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}  # (day, activity, student, session, provider, model) -> [요청, 입력, 출력, 이미지, 비용]
+        self._pending_records = 0
+        self._last_flush = time.time()
+        self._last_prune = 0
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if not self._initialized:
+            conn.execute(USAGE_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def record(self, key, provider, model, prompt_tokens=0, completion_tokens=0, images=0):
+        """key는 요청 제한과 같은 (활동 코드, 학생 이름, 세션) 튜플입니다. 이름은 저장할 때 가명 ID로 바뀝니다."""
+        day = datetime.date.today().isoformat()
+        row_key = (day, *key, provider, model)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, images)
+        with self._lock:
+            totals = self._pending.setdefault(row_key, [0, 0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += images
+            totals[4] += cost
+            self._pending_records += 1
+            due = (
+                self._pending_records >= FLUSH_EVERY_RECORDS
+                or time.time() - self._last_flush >= FLUSH_INTERVAL_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        # 쌓인 합계를 한 번의 트랜잭션으로 저장
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_records = 0
+            self._last_flush = time.time()
+        if not pending:
+            return
+        ids = result_archive.pseudonyms((row_key[1], row_key[2]) for row_key in pending)
+        rows = {}
+        for (day, code, name, *rest), totals in pending.items():
+            merged = rows.setdefault((day, code, ids[(code, name)], *rest), [0, 0, 0, 0, 0.0])
+            for index, value in enumerate(totals):
+                merged[index] += value
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, activity_code, student_id, session_id, provider, model) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens = completion_tokens + excluded.completion_tokens,
+                        images = images + excluded.images,
+                        cost = cost + excluded.cost
+                    """,
+                    [(*row_key, *totals) for row_key, totals in rows.items()],
+                )
+                if time.time() - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+                    cutoff = (datetime.date.today() - datetime.timedelta(days=MAX_AGE_DAYS)).isoformat()
+                    conn.execute("DELETE FROM usage WHERE day < ?", (cutoff,))
+                    self._last_prune = time.time()
+        finally:
+            conn.close()
+
+    def query(self, sql, params=()):
+        # 관리자 화면용 조회 (조회 전에 메모리의 기록부터 저장)
+        self.flush()
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+
+# 프로세스 전체에서 공유하는 기록기
+usage_recorder = UsageRecorder()
+atexit.register(usage_recorder.flush)
+
+
+def record_usage(key, provider, model, response=None, images=0):
+    # 페이지에서 호출: 응답의 토큰 사용량을 꺼내 기록
+    prompt_tokens, completion_tokens = response_tokens(provider, response)
+    usage_recorder.record(key, provider, model, prompt_tokens, completion_tokens, images)